@@ -0,0 +1,374 @@
+"""
+Compiled blocks
+
+Function bodies, and loops and conditionals once they're complete, are parsed
+into a tree of nodes before they run. Each node's run method returns None to
+carry on, or a signal from base.common: BREAK, Return or TailCall. Signals are
+passed up until a loop or function deals with them, so returning from a
+function or breaking out of a loop doesn't need to raise anything.
+
+The REPLControl exceptions are still raised by the keyword handlers when
+return, break or shift are evaluated as plain lines, for example from a file
+that's being sourced. run turns them back into signals.
+"""
+
+from .base import common, sink, syntax
+
+import re, sys
+
+def split_keyword(line):
+    words = line.split(None, 1)
+    return (words + ["", ""])[:2]
+
+def first_word(line):
+    return split_keyword(line)[0]
+
+# Keywords that open and close nested blocks, for blocks that are being
+# appended to a line at a time
+openers = ["while", "for", "if"]
+closers = ["done", "endif"]
+
+def nesting(line):
+    """
+    How a line changes the depth of nested blocks
+    """
+    word = first_word(line)
+    if word in openers: return 1
+    if word in closers: return -1
+    return 0
+
+def run(owner, nodes, function = None):
+    for node in nodes:
+        if function is not None:
+            owner.stack_top().line_number = node.number
+
+        if type(node) is not Line:
+            signal = node.run(owner, function)
+            if signal is not None:
+                return signal
+            continue
+
+        # Lines are evaluated here rather than in a method of their own, since
+        # every python frame between a function and the functions it calls
+        # makes for less recursion before python's limit
+        try:
+            show(owner.eval(node.line))
+        except common.REPLTailCall as e:
+            return common.TailCall(e.bits)
+        except common.REPLReturn as e:
+            return common.Return(e.value)
+        except common.REPLBreak:
+            return common.BREAK
+        except common.REPLFunctionShift:
+            if function is None: raise
+            function.shift()
+
+    return None
+
+def throw(signal):
+    """
+    Turn a signal that escaped a block back into an exception, for blocks that
+    were evaluated a line at a time
+    """
+    if signal is None:
+        return
+    if signal is common.BREAK:
+        raise common.REPLBreak()
+    if isinstance(signal, common.TailCall):
+        raise common.REPLTailCall(signal.bits)
+    raise common.REPLReturn(signal.value)
+
+def show(output):
+    if output: print(output.strip("\n"))
+
+class Line:
+    """
+    A line to evaluate. Run by the run function itself
+    """
+    def __init__(self, number, line):
+        self.number = number
+        self.line = line
+
+class Return:
+    def __init__(self, number, value):
+        self.number = number
+        self.value = value
+
+    def run(self, owner, function):
+        return owner.return_signal(self.value)
+
+class Break:
+    def __init__(self, number):
+        self.number = number
+
+    def run(self, owner, function):
+        return common.BREAK
+
+class Shift:
+    def __init__(self, number):
+        self.number = number
+
+    def run(self, owner, function):
+        if function is None:
+            raise common.REPLFunctionShift()
+        function.shift()
+
+class If:
+    def __init__(self, number, chain):
+        self.number = number
+        # Pairs of predicates and blocks. A predicate of None is an else
+        self.chain = chain
+
+    def run(self, owner, function):
+        for predicate, block in self.chain:
+            if predicate is not None:
+                owner.eval(predicate)
+                if str(owner.get("?")) != "0":
+                    continue
+
+            return run(owner, block, function)
+
+        return None
+
+class While:
+    def __init__(self, number, condition, block):
+        self.number = number
+        self.condition = condition
+        self.block = block
+
+    def run(self, owner, function):
+        show(owner.eval(self.condition))
+        while str(owner.get("?")) == "0":
+            signal = run(owner, self.block, function)
+            if signal is common.BREAK:
+                break
+            if signal is not None:
+                return signal
+            show(owner.eval(self.condition))
+
+        return None
+
+class For:
+    modes = ["in", "range", "lines", "of"]
+
+    def __init__(self, number, variable, mode, header, block):
+        self.number = number
+        self.variable = variable
+        self.mode = mode
+        self.header = header
+        self.block = block
+
+    def values(self, owner):
+        """
+        Lazily produce the values to bind, according to the loop's mode
+        """
+        if self.mode == "lines":
+            return (line.rstrip("\n") for line in owner.current_stdin())
+
+        words = owner.expand_words(self.header)
+
+        if self.mode == "in":
+            return iter(words)
+
+        if self.mode == "range":
+            try:
+                bounds = [int(word) for word in words]
+                return (str(i) for i in range(*bounds))
+            except (ValueError, TypeError):
+                raise common.REPLRuntimeError("for: range expects one to " +
+                        "three integers")
+
+        # of: iterate over a list variable, or the keys of a map variable
+        if len(words) != 1:
+            raise common.REPLRuntimeError("for: of expects a variable name")
+        value = owner.get(words[0])
+        if not isinstance(value, (list, dict)):
+            raise common.REPLRuntimeError("for: {} is not a list or map"
+                    .format(words[0]))
+        return (str(item) for item in list(value))
+
+    def run(self, owner, function):
+        for value in self.values(owner):
+            owner.set(self.variable, value)
+            signal = run(owner, self.block, function)
+            if signal is common.BREAK:
+                break
+            if signal is not None:
+                return signal
+
+        return None
+
+class Piped:
+    """
+    A block at the end of a pipeline, as in `cmd | while read line`
+    """
+    def __init__(self, number, pipeline, block):
+        self.number = number
+        self.pipeline = pipeline
+        self.block = block
+
+    def run(self, owner, function):
+        out = sink.Pipe()
+        owner.eval(self.pipeline, out)
+        previous, sys.stdin = sys.stdin, out.rewind()
+        try:
+            return self.block.run(owner, function)
+        finally:
+            sys.stdin = previous
+
+def for_header(bits):
+    """
+    Check the words after for, returning the variable, the mode and the words
+    the mode works on
+    """
+    if len(bits) < 2 or str(bits[1]) not in For.modes:
+        raise common.REPLSyntaxError("Usage: for name {in words..., "
+                "range [start] end [step], lines, of name}")
+    if not re.match("^[a-zA-Z0-9_-]+$", str(bits[0])):
+        raise common.REPLSyntaxError("Invalid identifier name")
+    return str(bits[0]), str(bits[1]), bits[2:]
+
+class Builder:
+    """
+    A loop being typed in a line at a time. Lines are kept until the done
+    that matches the loop's header, and then the loop is compiled and run,
+    reading from whatever was piped into its header line
+    """
+    def __init__(self, owner, name, stdin = None):
+        self.__owner = owner
+        self.__name = name
+        self.__stdin = stdin
+        self.__contents = []
+
+        # Depth of blocks nested inside this one, so their ends aren't
+        # mistaken for ours
+        self.__depth = 0
+
+    @property
+    def name(self):
+        return self.__name
+
+    def node(self, block):
+        """
+        The loop's compiled node, given its compiled body
+        """
+        raise NotImplementedError
+
+    def complete(self):
+        self.__owner.complete_block()
+
+        loop = self.node(compile(self.__contents))
+
+        previous = sys.stdin
+        if self.__stdin is not None:
+            sys.stdin = self.__stdin
+        try:
+            throw(loop.run(self.__owner, None))
+        finally:
+            sys.stdin = previous
+
+    def append(self, line):
+        line = line.strip()
+
+        if self.__depth == 0 and first_word(line) == "done":
+            self.complete()
+        else:
+            self.__depth = max(0, self.__depth + nesting(line))
+            self.__contents.append(line)
+
+def compile(lines):
+    """
+    Parse lines of REPL code into a list of nodes
+    """
+    lines = [line.strip() for line in lines]
+    nodes, position = parse(lines, 0)
+    if position < len(lines):
+        raise common.REPLSyntaxError("Unexpected {} on line {}"
+                .format(first_word(lines[position]), position + 1))
+    return nodes
+
+def parse(lines, position, terminators = ()):
+    """
+    Parse nodes up to, but not including, a line starting with one of the
+    terminators. Returns the nodes and the position of that line
+    """
+    nodes = []
+    while position < len(lines):
+        line = lines[position]
+        word = first_word(line)
+        number = position + 1
+
+        if word in terminators:
+            return nodes, position
+
+        if not line or line[0] == "#":
+            position += 1
+            continue
+
+        if word in openers:
+            node, position = parse_block(lines, position, line)
+            nodes.append(node)
+            continue
+
+        position += 1
+
+        if word == "return":
+            nodes.append(Return(number, syntax.split_whitespace(line)[1:]))
+        elif word == "break":
+            nodes.append(Break(number))
+        elif word == "shift":
+            nodes.append(Shift(number))
+        elif "|" in line and first_word(line.rpartition("|")[2]) in openers:
+            pipeline, _, header = line.rpartition("|")
+            node, position = parse_block(lines, position - 1, header.strip())
+            nodes.append(Piped(number, pipeline, node))
+        else:
+            nodes.append(Line(number, line))
+
+    if terminators:
+        raise common.REPLSyntaxError("Expected {} before end of block"
+                .format(" or ".join(terminators)))
+
+    return nodes, position
+
+def parse_block(lines, position, header):
+    """
+    Parse a while, for or if block whose first line is at position, given
+    that line's header. Returns the node and the position after the block
+    """
+    number = position + 1
+    word, rest = split_keyword(header)
+
+    if word == "while":
+        if not rest:
+            raise common.REPLSyntaxError("Loop must have condition")
+        block, position = parse(lines, position + 1, ["done"])
+        return While(number, rest, block), position + 1
+
+    if word == "for":
+        variable, mode, words = for_header(
+                syntax.split_whitespace(rest) if rest else [])
+        block, position = parse(lines, position + 1, ["done"])
+        return For(number, variable, mode, words, block), position + 1
+
+    # if, possibly followed by elifs and an else
+    if not rest:
+        raise common.REPLSyntaxError("Conditional block must have predicate")
+
+    chain = []
+    predicate = rest
+    while True:
+        block, position = parse(lines, position + 1,
+                ["elif", "else", "endif"])
+        chain.append((predicate, block))
+
+        word, rest = split_keyword(lines[position])
+        if word == "endif":
+            return If(number, chain), position + 1
+        if word == "elif":
+            if not rest:
+                raise common.REPLSyntaxError(
+                        "Conditional block must have predicate")
+            predicate = rest
+        else:
+            predicate = None
@@ -1,16 +1,17 @@
+from . import Block
 
-from .base import common
+import sys
 
 class Conditional:
     def __init__(self, owner, condition):
         self.__owner = owner
         self.__name = "Conditional"
 
-        self.__condition = condition
+        self.__condition = str(condition)
         self.__block = []
 
         self.__chain = []
-        self.__else_block = []
+        self.__depth = 0
 
     @property
     def name(self):
@@ -18,29 +19,26 @@ class Conditional:
 
     def complete(self):
         self.__owner.complete_block()
-        for pred, blk in self.__chain:
-            self.__owner.eval(pred)
-            if str(self.__owner.get("?")) != "0":
-                continue
-
-            for line in blk:
-                try:
-                    res = self.__owner.eval(line)
-                except common.REPLFunctionShift as e:
-                    self.__owner.stack_top().obj.callable.shift()
-                    continue
-                if res: print(res.strip("\n"))
-            return
+
+        conditional = Block.If(1, [(pred, Block.compile(blk))
+            for pred, blk in self.__chain])
+
+        Block.throw(conditional.run(self.__owner, None))
 
     # Stupidly, it's not a syntax error to have an else clause in the middle
     # of a conditional chain, even though it's not particularly useful to do
     # so
     def append(self, line):
         line = line.strip()
-        if line.startswith("endif"):
+        word = Block.first_word(line)
+
+        if self.__depth > 0 or word not in ("endif", "elif", "else"):
+            self.__depth = max(0, self.__depth + Block.nesting(line))
+            self.__block.append(line)
+        elif word == "endif":
             self.__chain.append((self.__condition, self.__block))
             self.complete()
-        elif line.startswith("elif"):
+        elif word == "elif":
             if len(line.split(" ")) == 1:
                 sys.stderr.write("Conditional block must have predicate\n")
                 self.__owner.discard_block()
@@ -49,11 +47,8 @@ class Conditional:
             self.__chain.append((self.__condition, self.__block))
             self.__condition = line.split(" ", 1)[-1]
             self.__block = []
-        elif line.startswith("else"):
+        else:
             self.__chain.append((self.__condition, self.__block))
-            self.__condition = "true" # Kill me
+            self.__condition = None # Always taken
             self.__block = []
-        else:
-            self.__block.append(line)
         return self
-
@@ -0,0 +1,11 @@
+from . import Block
+
+class For(Block.Builder):
+    def __init__(self, owner, variable, mode, header, stdin):
+        super().__init__(owner, "For", stdin)
+        self.__variable = variable
+        self.__mode = mode
+        self.__header = header
+
+    def node(self, block):
+        return Block.For(1, self.__variable, self.__mode, self.__header, block)
@@ -1,8 +1,93 @@
 
-from . import formatter
-from .base import command, syntax, common
+from . import formatter, Block
+from .base import cache, command, environment, common
+
+from contextlib import redirect_stdout
+import io, re, sys
+
+class Frame(dict):
+    """
+    Bindings for one call of a function. The arguments are kept as a vector
+    and an offset into it, and $1..$n, $# and $@ are worked out when they're
+    looked up, so shifting only moves the offset. Named parameters and local
+    variables are ordinary entries.
+    """
+    def __init__(self, name, args, argspec):
+        super().__init__({"FUNCTION": name, "0": name})
+
+        self.__args = tuple(args)
+        self.__offset = 0
+        self.__argspec = argspec
+        self.__dropped = 0
+
+        # $@ for the current offset, once it's been asked for
+        self.__all = None
+
+        self.bind_names()
+
+    def bind_names(self):
+        """
+        Named parameters take the arguments after the offset, except that
+        once too few are left they're unset from the first name on
+        """
+        remaining = len(self.__args) - self.__offset
+        dropped = max(0, len(self.__argspec) - remaining)
+
+        for name in self.__argspec[self.__dropped:dropped]:
+            self.pop(name, None)
+        self.__dropped = dropped
+
+        for position in range(dropped, len(self.__argspec)):
+            self[self.__argspec[position]] = \
+                    self.__args[self.__offset + position - dropped]
 
-import re
+    def shift(self):
+        if self.__offset < len(self.__args):
+            self.__offset += 1
+            self.__all = None
+        self.bind_names()
+
+    def positional(self, name):
+        """
+        The value of $#, $@ or $n, or None if name isn't one of those or is
+        out of range
+        """
+        if name == "#":
+            return str(len(self.__args) - self.__offset)
+
+        if name == "@":
+            if self.__all is None:
+                self.__all = environment.ListValue(
+                        self.__args[self.__offset:])
+            return self.__all
+
+        if name.isdigit() and name != "0":
+            position = self.__offset + int(name) - 1
+            if position < len(self.__args):
+                return self.__args[position]
+
+        return None
+
+    def get(self, name, default = None):
+        value = self.positional(name)
+        if value is not None:
+            return value
+        return super().get(name, default)
+
+    def __getitem__(self, name):
+        value = self.get(name)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def items(self):
+        positionals = ["#", "@"] + [str(position) for position in
+                range(1, len(self.__args) - self.__offset + 1)]
+        return (list(super().items())
+                + [(name, self.positional(name)) for name in positionals])
 
 class REPLFunction:
     # This requires further thought
@@ -12,16 +97,24 @@ class REPLFunction:
         "^[0-9]"
     )
 
-    def __init__(self, owner, name, argspec = None):
+    # Number of distinct calls remembered by a `function --memo`
+    memo_size = 4096
+
+    def __init__(self, owner, name, argspec = None, memo = False):
         self.__name = name
         self.__owner = owner
         self.__variadic = argspec[-1] == "..." if argspec else False
         self.__argspec = argspec[:-1] if self.__variadic else argspec
 
         self.__contents = []
+        self.__body = []
+
+        # Output and status by argument tuple. Each definition gets its own
+        # cache, so redefining or undef-ing the function throws it away
+        self.__memo = cache.LRUCache(self.memo_size) if memo else None
 
-        self.args_ = None
-        self.argspec_ = None
+        # The frame of the innermost call in progress
+        self.bindings = None
 
     @property
     def name(self):
@@ -31,20 +124,29 @@ class REPLFunction:
     def argspec(self):
         return self.__argspec
 
+    @property
+    def memo(self):
+        return self.__memo
+
     def complete(self, line):
         self.__owner.finish_block()
 
+        self.__body = Block.compile(self.__contents)
+
         usagestring = \
                 ("{} args".format(self.__name)
                 if not self.__argspec
                 else "{} {}".format(self.__name,
                     " ".join(self.__argspec)))
 
+        header = ("function --memo" if self.__memo is not None
+                else "function")
+
         helpstring = \
-            ("function {}\n".format(self.__name)
+            ("{} {}\n".format(header, self.__name)
             + formatter.format(self.__contents, depth = 1) + "\nendfunction"
             if not self.__argspec else
-            "function {} {}\n".format(self.__name,
+            "{} {} {}\n".format(header, self.__name,
                 " ".join(self.__argspec))
             + formatter.format(self.__contents, depth = 1) + "\nendfunction"
             )
@@ -71,40 +173,8 @@ class REPLFunction:
 
         return self
 
-    def make_bindings(self, args, argspec):
-        bindings = {
-            "FUNCTION": self.__name,
-            "#": str(len(args)),
-            "@": " ".join([syntax.quote(arg) for arg in args]),
-            "0": self.__name,
-        }
-
-        for position, argument in enumerate(args):
-            bindings[str(position + 1)] = argument
-
-        for name, argument in zip(argspec, args):
-            bindings[name] = argument
-
-        return bindings
-
     def shift(self):
-        self.args_ = self.args_[1:]
-
-        to_unset = None
-        if len(self.args_) < len(self.argspec_):
-            to_unset = self.argspec_[0]
-            self.argspec_ = self.argspec_[1:]
-
-        bindings = self.make_bindings(self.args_, self.argspec_)
-
-        # Unset last argument
-        del self.bindings[str(len(self.args_))]
-        if to_unset:
-            del self.bindings[str(to_unset)]
-
-        # Apply shift down
-        for k, v in bindings.items():
-            self.bindings[k] = v
+        self.bindings.shift()
 
     def calledIncorrectly(self, args):
         if not self.__argspec: return False
@@ -114,28 +184,55 @@ class REPLFunction:
             return len(args) != len(self.__argspec)
 
     def __call__(self, *args):
+        if self.__memo is None:
+            return self.trampoline(self.run(args))
+
+        key = tuple(str(arg) for arg in args)
+        remembered = self.__memo.get(key)
+        if remembered is None:
+            with redirect_stdout(io.StringIO()) as output:
+                result = self.trampoline(self.run(args))
+            remembered = (output.getvalue(), result)
+            self.__memo.put(key, remembered)
+
+        output, result = remembered
+        sys.stdout.write(output)
+        return result
+
+    def trampoline(self, outcome):
+        """
+        Make tail calls one after the other instead of one inside the other,
+        so tail recursion doesn't grow the python stack
+        """
+        while isinstance(outcome, common.TailCall):
+            outcome = self.__owner.tail_call(outcome.bits)
+        return outcome
+
+    def run(self, args):
+        """
+        Run the body once, returning either the return value or the tail call
+        the body ended with
+        """
         if self.calledIncorrectly(args):
             raise common.REPLRuntimeError("Usage: {} {}"
                     .format(self.__name, " ".join(self.__argspec)))
 
-        self.argspec_ = self.__argspec[:]
-        self.args_ = args
+        frame = Frame(self.__name, args, self.__argspec)
+        previous, self.bindings = self.bindings, frame
 
-        self.bindings = self.make_bindings(self.args_, self.argspec_)
-
-        self.__owner.add_scope(self.bindings, self.__name)
+        self.__owner.add_scope(frame, self.__name)
 
         try:
-            for line in self.__contents:
-                try:
-                    res = self.__owner.eval(line)
-                    self.__owner.stack_top().line_number += 1
-                    if res: print(res.strip("\n"))
-                except common.REPLReturn as e:
-                    return e.value
-                except common.REPLFunctionShift as e:
-                    self.shift()
-                    continue
+            signal = Block.run(self.__owner, self.__body, self)
         finally:
             self.__owner.pop_scope()
-
+            self.bindings = previous
+
+        if signal is common.BREAK:
+            # Not in a loop here, so break out of whichever loop called us
+            raise common.REPLBreak()
+        if isinstance(signal, common.TailCall):
+            return signal
+        if isinstance(signal, common.Return):
+            return signal.value
+        return None
@@ -0,0 +1,90 @@
+
+"""
+Caches
+
+* Bounded, least-recently-used mappings from keys to values
+* Count hits, misses and evictions so callers can report on them
+"""
+
+from collections import OrderedDict
+
+class LRUCache:
+    def __init__(self, maxsize = 1024):
+        if maxsize < 0:
+            raise ValueError("Cache size must not be negative")
+
+        self.__maxsize = maxsize
+        self.__entries = OrderedDict()
+
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+
+    @property
+    def maxsize(self):
+        return self.__maxsize
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, key):
+        return key in self.__entries
+
+    def get(self, key, default = None):
+        try:
+            value = self.__entries[key]
+        except KeyError:
+            self.__misses += 1
+            return default
+
+        self.__entries.move_to_end(key)
+        self.__hits += 1
+        return value
+
+    def put(self, key, value):
+        if self.__maxsize == 0: return self
+
+        self.__entries[key] = value
+        self.__entries.move_to_end(key)
+        self.trim()
+        return self
+
+    def discard(self, key):
+        self.__entries.pop(key, None)
+        return self
+
+    def trim(self):
+        while len(self.__entries) > self.__maxsize:
+            self.__entries.popitem(last = False)
+            self.__evictions += 1
+        return self
+
+    def resize(self, maxsize):
+        if maxsize < 0:
+            raise ValueError("Cache size must not be negative")
+        self.__maxsize = maxsize
+        return self.trim()
+
+    def clear(self):
+        self.__entries.clear()
+        self.__hits = self.__misses = self.__evictions = 0
+        return self
+
+    def stats(self):
+        lookups = self.__hits + self.__misses
+        return {
+            "size": len(self.__entries),
+            "maxsize": self.__maxsize,
+            "hits": self.__hits,
+            "misses": self.__misses,
+            "evictions": self.__evictions,
+            "hit-rate": (self.__hits / lookups) if lookups else 0.0,
+        }
+
+    def report(self):
+        """
+        Stats as lines of text, suitable for printing from a command
+        """
+        stats = self.stats()
+        stats["hit-rate"] = "{:.2%}".format(stats["hit-rate"])
+        return ["{} {}".format(k, v) for k, v in stats.items()]
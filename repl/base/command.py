@@ -2,12 +2,21 @@
 import inspect, textwrap
 
 class Command:
-    def __init__(self, callable_, name = "", usage = "", helptext = ""):
+    def __init__(self, callable_, name = "", usage = "", helptext = "",
+            binary = False, pure = False):
         if not callable(callable_):
             raise TypeError("Command requires callable object")
 
         self.__callable = callable_
 
+        # Binary commands write bytes, with sink.write_bytes, so their output
+        # is collected as bytes and only decoded if it has to become text
+        self.__binary = binary
+
+        # Pure commands depend on nothing but their arguments, and change
+        # nothing but what they print, so their results can be reused
+        self.__pure = pure
+
         # This is nasty with lambda functions
         self.__name = name if name else callable.__name__
 
@@ -23,7 +32,9 @@ class Command:
             callable_ = self.__callable,
             name = self.__name,
             usage = self.__usage,
-            helptext = self.__helptext
+            helptext = self.__helptext,
+            binary = self.__binary,
+            pure = self.__pure
         )
 
     @property
@@ -34,6 +45,14 @@ class Command:
     def name(self):
         return self.__name
 
+    @property
+    def binary(self):
+        return self.__binary
+
+    @property
+    def pure(self):
+        return self.__pure
+
     @property
     def usage(self):
         return "Usage: " + self.__usage
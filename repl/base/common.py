@@ -8,8 +8,33 @@ class REPLReturn(REPLControl):
     def __init__(self, value):
         self.value = value
 
+class REPLTailCall(REPLReturn):
+    """
+    A function returning a backquoted command: the caller runs the command in
+    place of the function, rather than the function running it on top of
+    itself
+    """
+    def __init__(self, bits):
+        super().__init__(None)
+        self.bits = bits
+
 class REPLFunctionShift(REPLControl): pass
 
+# Compiled blocks hand these back instead of raising the exceptions above,
+# which are only used when lines are evaluated one at a time
+
+class Break: pass
+BREAK = Break()
+
+class Return:
+    def __init__(self, value):
+        self.value = value
+
+class TailCall(Return):
+    def __init__(self, bits):
+        super().__init__(None)
+        self.bits = bits
+
 class REPLSyntaxError(REPLError): pass
 class REPLRuntimeError(REPLError): pass
 
@@ -0,0 +1,165 @@
+"""
+Disk caches
+
+* Keep command output in files named by a hash of what produced it, so that it
+outlives the session and can be shared between processes
+* Entries expire after a time to live, and the least recently used are thrown
+away once the cache grows past a size limit
+"""
+
+import hashlib, json, os, tempfile, time
+
+class DiskCache:
+    def __init__(self, directory, maxbytes = 64 << 20):
+        if maxbytes < 0:
+            raise ValueError("Cache size must not be negative")
+
+        self.__directory = directory
+        self.__maxbytes = maxbytes
+
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+
+    @property
+    def directory(self):
+        return self.__directory
+
+    @staticmethod
+    def digest(key):
+        """
+        A file name for a key, which may be anything json can encode
+        """
+        return hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()
+
+    def __path(self, key):
+        return os.path.join(self.__directory, self.digest(key))
+
+    def get(self, key, ttl = None, default = None):
+        """
+        The value stored for key, unless it's missing or older than ttl
+        seconds
+        """
+        path = self.__path(key)
+        try:
+            with open(path, "rb") as f:
+                header = json.loads(f.readline())
+                data = f.read()
+        except (OSError, ValueError):
+            self.__misses += 1
+            return default
+
+        if ttl is not None and time.time() - header["created"] > ttl:
+            self.discard(key)
+            self.__misses += 1
+            return default
+
+        # Mark it as recently used, for eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        self.__hits += 1
+        return data, header["status"]
+
+    def put(self, key, output, status):
+        """
+        Store output, as bytes, and a status for key
+        """
+        os.makedirs(self.__directory, exist_ok = True)
+
+        header = json.dumps({"created": time.time(), "status": status,
+            "key": key})
+
+        # Write somewhere else and move it into place, so other processes
+        # never see half an entry
+        fd, temporary = tempfile.mkstemp(dir = self.__directory,
+                prefix = ".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header.encode("utf-8") + b"\n")
+                f.write(output)
+            os.replace(temporary, self.__path(key))
+        except:
+            os.unlink(temporary)
+            raise
+
+        return self.trim()
+
+    def discard(self, key):
+        try:
+            os.unlink(self.__path(key))
+        except OSError:
+            pass
+        return self
+
+    def entries(self):
+        """
+        Paths, sizes and last use times of the entries, oldest first
+        """
+        try:
+            names = os.listdir(self.__directory)
+        except OSError:
+            return []
+
+        entries = []
+        for name in names:
+            if name.startswith("."): continue
+            path = os.path.join(self.__directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        return [(path, size, used) for used, size, path in sorted(entries)]
+
+    def trim(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.__maxbytes: break
+            try:
+                os.unlink(path)
+                self.__evictions += 1
+            except OSError:
+                pass
+            total -= size
+        return self
+
+    def resize(self, maxbytes):
+        if maxbytes < 0:
+            raise ValueError("Cache size must not be negative")
+        self.__maxbytes = maxbytes
+        return self.trim()
+
+    def clear(self):
+        for path, _, _ in self.entries():
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        self.__hits = self.__misses = self.__evictions = 0
+        return self
+
+    def stats(self):
+        entries = self.entries()
+        lookups = self.__hits + self.__misses
+        return {
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "maxbytes": self.__maxbytes,
+            "hits": self.__hits,
+            "misses": self.__misses,
+            "evictions": self.__evictions,
+            "hit-rate": (self.__hits / lookups) if lookups else 0.0,
+        }
+
+    def report(self):
+        """
+        Stats as lines of text, suitable for printing from a command
+        """
+        stats = self.stats()
+        stats["hit-rate"] = "{:.2%}".format(stats["hit-rate"])
+        return ["{} {}".format(k, v) for k, v in stats.items()]
@@ -7,7 +7,104 @@ Environments
 environments
 """
 
-import json
+import codecs, json, tempfile
+
+from . import syntax
+
+# Text values longer than this many characters are kept in a temporary file
+# rather than in memory. None keeps everything in memory
+spill_threshold = 1 << 20
+
+class ListValue(list):
+    """
+    A list bound directly in an environment. Indexing, length and appending
+    don't touch any text; it only becomes text when expanded as a whole, as
+    its quoted elements separated by spaces.
+    """
+    def __str__(self):
+        return " ".join([syntax.quote(str(item)) for item in self])
+
+class MapValue(dict):
+    """
+    A dict bound directly in an environment. It only becomes text, as JSON,
+    when expanded as a whole.
+    """
+    def __str__(self):
+        return json.dumps(self)
+
+class SpilledValue:
+    """
+    A long text value kept in a temporary file. It's only read back in full
+    when it's expanded; its length is known without reading it, and slices
+    are read a chunk at a time.
+    """
+    chunk_size = 1 << 16
+
+    def __init__(self, text):
+        # Undecodable bytes from a pipeline are held as surrogates, and go
+        # back to being the bytes they were
+        data = text.encode("utf-8", "surrogateescape")
+        self.__length = len(text)
+
+        # With nothing but ascii, characters and bytes line up, so slices can
+        # seek straight to where they start
+        self.__ascii = data.isascii()
+
+        self.__file = tempfile.TemporaryFile()
+        self.__file.write(data)
+
+    def __len__(self):
+        return self.__length
+
+    def __str__(self):
+        self.__file.seek(0)
+        return self.__file.read().decode("utf-8", "surrogateescape")
+
+    def chunks(self, start = 0, end = None):
+        """
+        The characters from start up to end, a piece at a time
+        """
+        end = self.__length if end is None else min(end, self.__length)
+        if start >= end: return
+
+        if self.__ascii:
+            self.__file.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                data = self.__file.read(min(self.chunk_size, remaining))
+                if not data: return
+                remaining -= len(data)
+                yield data.decode("ascii")
+            return
+
+        decoder = codecs.getincrementaldecoder("utf-8")("surrogateescape")
+        self.__file.seek(0)
+        position = 0
+        while position < end:
+            data = self.__file.read(self.chunk_size)
+            text = decoder.decode(data, final = not data)
+            if not text and not data: return
+
+            piece = text[max(0, start - position):end - position]
+            position += len(text)
+            if piece: yield piece
+
+def store(value):
+    """
+    How a text value should be held: as it is, or in a temporary file if it's
+    long enough
+    """
+    if (spill_threshold is not None and type(value) == str
+            and len(value) > spill_threshold):
+        return SpilledValue(value)
+    return value
+
+def wrap(value):
+    if type(value) == list:
+        return ListValue(value)
+    if type(value) == dict:
+        return MapValue(value)
+    return value
 
 class Environment:
     def __init__(self, name = "(?)", upstream = None, default_value = "",
@@ -90,7 +187,8 @@ class Environment:
         return self.get(name)
 
     def load_from(self, file_like):
-        self.__bindings = json.load(file_like)
+        self.__bindings = { k: wrap(v) for k, v in
+                json.load(file_like).items() }
 
     def write_to(self, file_like):
         json.dump(self.__bindings, file_like, indent = 4, sort_keys = True)
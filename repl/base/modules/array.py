@@ -0,0 +1,555 @@
+"""
+Arrays
+
+* Typed arrays of numbers, held by name outside of the REPL's variables
+* Bulk operations that run over a whole array in one command, instead of one
+  eval per element
+* Backed by numpy when it is installed, and by the array module otherwise
+"""
+
+from .. import command
+
+import array
+import operator
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def commands():
+    store = ArrayStore(NumpyBackend() if numpy else ArrayBackend())
+
+    return [
+        make_array_new_command(store),
+        make_array_from_command(store),
+        make_array_fill_command(store),
+        make_array_print_command(store),
+        make_array_get_command(store),
+        make_array_set_command(store),
+        make_array_len_command(store),
+        make_array_op_command(store),
+        make_array_shift_command(store),
+        make_array_slice_command(store),
+        make_array_reduce_command(store),
+        make_array_drop_command(store),
+        make_array_list_command(store),
+    ]
+
+kinds = ["int", "float", "byte"]
+
+comparisons = ["lt", "le", "gt", "ge", "eq", "ne"]
+logical = ["and", "or", "xor"]
+unary = ["not", "neg", "abs"]
+
+def convert(kind, value):
+    if kind == "float":
+        return float(value)
+    return int(value)
+
+def result_kind(op, lhs, rhs):
+    """
+    Comparisons give bytes, division gives floats, logic on bytes stays in
+    bytes, and anything else widens to float if either side is a float
+    """
+    if op in comparisons or op == "not":
+        return "byte"
+    if op == "div" or "float" in [lhs, rhs]:
+        return "float"
+    if op in logical and lhs == rhs == "byte":
+        return "byte"
+    return "int"
+
+class ArrayBackend:
+    name = "array"
+
+    typecodes = {"int": "q", "float": "d", "byte": "b"}
+
+    binary = {
+        "add": operator.add,
+        "sub": operator.sub,
+        "mul": operator.mul,
+        "div": operator.truediv,
+        "mod": operator.mod,
+        "and": operator.and_,
+        "or": operator.or_,
+        "xor": operator.xor,
+        "min": min,
+        "max": max,
+        "lt": lambda lhs, rhs: int(lhs < rhs),
+        "le": lambda lhs, rhs: int(lhs <= rhs),
+        "gt": lambda lhs, rhs: int(lhs > rhs),
+        "ge": lambda lhs, rhs: int(lhs >= rhs),
+        "eq": lambda lhs, rhs: int(lhs == rhs),
+        "ne": lambda lhs, rhs: int(lhs != rhs),
+    }
+
+    unary = {
+        "not": lambda x: int(not x),
+        "neg": operator.neg,
+        "abs": abs,
+    }
+
+    reductions = {
+        "sum": sum,
+        "min": min,
+        "max": max,
+        "any": lambda a: int(any(a)),
+        "all": lambda a: int(all(a)),
+    }
+
+    def make(self, kind, values):
+        return array.array(self.typecodes[kind],
+                (convert(kind, value) for value in values))
+
+    def kind(self, a):
+        for kind, typecode in self.typecodes.items():
+            if a.typecode == typecode:
+                return kind
+
+    def values(self, a):
+        return a.tolist()
+
+    def item(self, a, i):
+        return a[i]
+
+    def apply(self, op, lhs, rhs = None):
+        kind = result_kind(op, self.kind(lhs),
+                None if rhs is None else self.kind_of(rhs))
+
+        if op in self.unary:
+            return self.make(kind, map(self.unary[op], lhs))
+
+        function = self.binary[op]
+        if isinstance(rhs, array.array):
+            if len(lhs) != len(rhs):
+                raise ValueError("Arrays differ in length")
+            return self.make(kind, map(function, lhs, rhs))
+        return self.make(kind, (function(x, rhs) for x in lhs))
+
+    def kind_of(self, operand):
+        if isinstance(operand, array.array):
+            return self.kind(operand)
+        return "float" if type(operand) == float else "int"
+
+    def shift(self, a, n, fill):
+        n = max(-len(a), min(len(a), n))
+        padding = array.array(a.typecode, [fill] * abs(n))
+        if n >= 0:
+            return padding + a[:len(a) - n]
+        return a[-n:] + padding
+
+    def slice(self, a, start, end):
+        return a[start:end]
+
+    def reduce(self, op, a):
+        if op == "prod":
+            product = 1
+            for x in a: product *= x
+            return product
+        return self.reductions[op](a)
+
+class NumpyBackend:
+    name = "numpy"
+
+    dtypes = {"int": "int64", "float": "float64", "byte": "int8"}
+
+    def __init__(self):
+        self.binary = {
+            "add": numpy.add,
+            "sub": numpy.subtract,
+            "mul": numpy.multiply,
+            "div": numpy.true_divide,
+            "mod": numpy.mod,
+            "and": numpy.bitwise_and,
+            "or": numpy.bitwise_or,
+            "xor": numpy.bitwise_xor,
+            "min": numpy.minimum,
+            "max": numpy.maximum,
+            "lt": numpy.less,
+            "le": numpy.less_equal,
+            "gt": numpy.greater,
+            "ge": numpy.greater_equal,
+            "eq": numpy.equal,
+            "ne": numpy.not_equal,
+        }
+
+        self.unary = {
+            "not": lambda a: a == 0,
+            "neg": numpy.negative,
+            "abs": numpy.absolute,
+        }
+
+        self.reductions = {
+            "sum": numpy.sum,
+            "prod": numpy.prod,
+            "min": numpy.min,
+            "max": numpy.max,
+            "any": lambda a: int(numpy.any(a)),
+            "all": lambda a: int(numpy.all(a)),
+        }
+
+    def make(self, kind, values):
+        if isinstance(values, numpy.ndarray):
+            return values.astype(self.dtypes[kind])
+        return numpy.array([convert(kind, value) for value in values],
+                dtype = self.dtypes[kind])
+
+    def kind(self, a):
+        for kind, dtype in self.dtypes.items():
+            if a.dtype == dtype:
+                return kind
+
+    def values(self, a):
+        return a.tolist()
+
+    def item(self, a, i):
+        return a[i].item()
+
+    def kind_of(self, operand):
+        if isinstance(operand, numpy.ndarray):
+            return self.kind(operand)
+        return "float" if type(operand) == float else "int"
+
+    def apply(self, op, lhs, rhs = None):
+        lhs_kind = self.kind(lhs)
+        rhs_kind = None if rhs is None else self.kind_of(rhs)
+        kind = result_kind(op, lhs_kind, rhs_kind)
+
+        # Work in the type of the result, or for comparisons the type both
+        # sides widen to, so bytes don't wrap around before they're widened
+        working = kind
+        if op in comparisons or op == "not":
+            working = result_kind("add", lhs_kind, rhs_kind)
+        dtype = self.dtypes[working]
+
+        lhs = lhs.astype(dtype, copy = False)
+        if op in self.unary:
+            return self.make(kind, self.unary[op](lhs))
+
+        if isinstance(rhs, numpy.ndarray):
+            if len(lhs) != len(rhs):
+                raise ValueError("Arrays differ in length")
+            rhs = rhs.astype(dtype, copy = False)
+        return self.make(kind, self.binary[op](lhs, rhs))
+
+    def shift(self, a, n, fill):
+        n = max(-len(a), min(len(a), n))
+        shifted = numpy.full_like(a, fill)
+        if n >= 0:
+            shifted[n:] = a[:len(a) - n]
+        else:
+            shifted[:n] = a[-n:]
+        return shifted
+
+    def slice(self, a, start, end):
+        return a[start:end].copy()
+
+    def reduce(self, op, a):
+        result = self.reductions[op](a)
+        return result.item() if isinstance(result, numpy.generic) else result
+
+class ArrayStore:
+    def __init__(self, backend):
+        self.backend = backend
+        self.__arrays = {}
+
+    def __contains__(self, name):
+        return name in self.__arrays
+
+    def get(self, name):
+        try:
+            return self.__arrays[name]
+        except KeyError:
+            raise LookupError("No array named {}".format(name))
+
+    def set(self, name, a):
+        self.__arrays[name] = a
+
+    def drop(self, name):
+        self.__arrays.pop(name, None)
+
+    def names(self):
+        return list(self.__arrays.keys())
+
+def number(arg):
+    try:
+        return int(arg)
+    except ValueError as e:
+        return float(arg)
+
+def index(arg):
+    return None if arg == ":" else int(arg)
+
+def format_value(x):
+    if type(x) == float and x.is_integer():
+        return str(int(x))
+    return str(x)
+
+def checked(function):
+    """
+    Report bad array names, lengths and values instead of letting them
+    escape as usage errors
+    """
+    def wrapper(*args):
+        try:
+            return function(*args)
+        except LookupError as e:
+            sys.stderr.write("{}\n".format(str(e).strip("'")))
+            return 2
+        except (ValueError, ZeroDivisionError, OverflowError) as e:
+            sys.stderr.write("{}\n".format(e))
+            return 2
+
+    return wrapper
+
+def check_kind(kind):
+    if kind not in kinds:
+        raise ValueError("Array type must be one of: {}"
+                .format(", ".join(kinds)))
+
+def make_array_new_command(store):
+    @checked
+    def array_new(name, kind, *values):
+        check_kind(kind)
+        store.set(name, store.backend.make(kind, values))
+        return 0
+
+    return command.Command(
+            array_new,
+            "array-new",
+            "array-new name {int, float, byte} [values...]",
+            "Create an array from a list of values"
+            )
+
+def make_array_from_command(store):
+    @checked
+    def array_from(name, kind, string, *separator):
+        check_kind(kind)
+        if separator:
+            values = string.split(separator[0])
+        elif any(c.isspace() for c in string):
+            values = string.split()
+        else:
+            values = list(string)
+
+        store.set(name, store.backend.make(kind, values))
+        return 0
+
+    return command.Command(
+            array_from,
+            "array-from",
+            "array-from name {int, float, byte} string [separator]",
+            command.helpfmt("""
+                Create an array by splitting a string on a separator, or on
+                whitespace. A string without whitespace is split into single
+                characters, so array-from cells byte 0110 makes four cells.
+                """)
+            )
+
+def make_array_fill_command(store):
+    @checked
+    def array_fill(name, kind, length, value):
+        check_kind(kind)
+        store.set(name, store.backend.make(kind, [value] * int(length)))
+        return 0
+
+    return command.Command(
+            array_fill,
+            "array-fill",
+            "array-fill name {int, float, byte} length value",
+            "Create an array holding length copies of value"
+            )
+
+def make_array_print_command(store):
+    @checked
+    def array_print(name, separator = " "):
+        print(separator.join(format_value(x) for x in
+            store.backend.values(store.get(name))))
+        return 0
+
+    return command.Command(
+            array_print,
+            "array-print",
+            "array-print name [separator]",
+            command.helpfmt("""
+                Print the elements of an array joined by a separator, a space
+                by default. Use "" to print them run together.
+                """)
+            )
+
+def make_array_get_command(store):
+    @checked
+    def array_get(name, i):
+        print(format_value(store.backend.item(store.get(name), int(i))))
+        return 0
+
+    return command.Command(
+            array_get,
+            "array-get",
+            "array-get name index",
+            "Print one element of an array"
+            )
+
+def make_array_set_command(store):
+    @checked
+    def array_set(name, i, value):
+        a = store.get(name)
+        a[int(i)] = convert(store.backend.kind(a), value)
+        return 0
+
+    return command.Command(
+            array_set,
+            "array-set",
+            "array-set name index value",
+            "Assign to one element of an array"
+            )
+
+def make_array_len_command(store):
+    @checked
+    def array_len(name):
+        print(len(store.get(name)))
+        return 0
+
+    return command.Command(
+            array_len,
+            "array-len",
+            "array-len name",
+            "Print the length of an array"
+            )
+
+def make_array_op_command(store):
+    operators = sorted(list(ArrayBackend.binary.keys()) + unary)
+
+    @checked
+    def array_op(dest, lhs, op, *rhs):
+        if op not in operators:
+            raise ValueError("Operator must be one of: {}"
+                    .format(", ".join(operators)))
+
+        if (op in unary) != (len(rhs) == 0) or len(rhs) > 1:
+            raise ValueError("{} takes {} operand".format(op,
+                "one" if op in unary else "a second"))
+
+        operand = None
+        if rhs:
+            [rhs] = rhs
+            operand = store.get(rhs) if rhs in store else number(rhs)
+
+        # numpy gives inf or 0 rather than failing, so divisors are checked
+        # before either backend starts
+        if op in ["div", "mod"]:
+            divisors = (store.backend.values(operand) if rhs in store
+                    else [operand])
+            if 0 in divisors:
+                raise ZeroDivisionError("{} by zero".format(
+                    "Division" if op == "div" else "Modulo"))
+
+        try:
+            result = store.backend.apply(op, store.get(lhs), operand)
+        except TypeError:
+            raise ValueError("{} needs integer operands".format(op))
+
+        store.set(dest, result)
+        return 0
+
+    return command.Command(
+            array_op,
+            "array-op",
+            "array-op dest lhs operator [rhs]",
+            command.helpfmt("""
+                Apply an operator elementwise and store the result in dest.
+                rhs is another array of the same length or a single number.
+                Operators: add sub mul div mod and or xor min max, the
+                comparisons lt le gt ge eq ne, which give 0 or 1, and the
+                unary not neg abs, which take no rhs.
+                """)
+            )
+
+def make_array_shift_command(store):
+    @checked
+    def array_shift(dest, src, n, fill = "0"):
+        a = store.get(src)
+        store.set(dest, store.backend.shift(a, int(n),
+            convert(store.backend.kind(a), fill)))
+        return 0
+
+    return command.Command(
+            array_shift,
+            "array-shift",
+            "array-shift dest src n [fill]",
+            command.helpfmt("""
+                Shift elements n places towards the end of the array, or
+                towards the start if n is negative, and store the result in
+                dest. Vacated places get fill, 0 by default.
+                """)
+            )
+
+def make_array_slice_command(store):
+    @checked
+    def array_slice(dest, src, start, end):
+        store.set(dest, store.backend.slice(store.get(src), index(start),
+            index(end)))
+        return 0
+
+    return command.Command(
+            array_slice,
+            "array-slice",
+            "array-slice dest src start-index end-index",
+            command.helpfmt("""
+                Copy part of an array into dest. start and end may be :,
+                indicating the ends of the array.
+                """)
+            )
+
+def make_array_reduce_command(store):
+    reductions = ["sum", "prod", "min", "max", "any", "all"]
+
+    @checked
+    def array_reduce(name, op):
+        if op not in reductions:
+            raise ValueError("Reduction must be one of: {}"
+                    .format(", ".join(reductions)))
+        a = store.get(name)
+        if len(a) == 0 and op in ["min", "max"]:
+            raise ValueError("Cannot take {} of an empty array".format(op))
+        print(format_value(store.backend.reduce(op, a)))
+        return 0
+
+    return command.Command(
+            array_reduce,
+            "array-reduce",
+            "array-reduce name {sum, prod, min, max, any, all}",
+            "Reduce an array to a single number"
+            )
+
+def make_array_drop_command(store):
+    def array_drop(*names):
+        for name in names:
+            store.drop(name)
+        return 0
+
+    return command.Command(
+            array_drop,
+            "array-drop",
+            "array-drop names...",
+            "Delete arrays"
+            )
+
+def make_array_list_command(store):
+    def array_list():
+        for name in store.names():
+            a = store.get(name)
+            print("{} {} {}".format(name, store.backend.kind(a), len(a)))
+        return 0
+
+    return command.Command(
+            array_list,
+            "array-list",
+            "array-list",
+            command.helpfmt("""
+                List arrays with their types and lengths. The backend in use
+                is {}.
+                """.format(store.backend.name))
+            )
@@ -1,6 +1,7 @@
 
 from .. import command
 import json
+import functools, getopt, re, sys
 
 def commands():
     return [
@@ -14,6 +15,9 @@ def commands():
         make_json_list_get_command(),
         make_json_list_set_command(),
         make_json_is_object_command(),
+        make_json_select_command(),
+        make_json_each_command(),
+        make_json_extract_command(),
     ]
 
 def make_json_object_command():
@@ -25,7 +29,8 @@ def make_json_object_command():
         json_object,
         "json-object",
         "json-object",
-        "Create an empty JSON object"
+        "Create an empty JSON object",
+        pure = True
     )
 
 def make_json_list_command():
@@ -37,7 +42,8 @@ def make_json_list_command():
         json_list,
         "json-list",
         "json-list",
-        "Create an empty JSON list"
+        "Create an empty JSON list",
+        pure = True
     )
 
 def make_json_list_append_command():
@@ -61,7 +67,8 @@ def make_json_list_append_command():
         json_list_append,
         "json-list-append",
         "json-list-append json-string value",
-        "Append a value to a JSON list"
+        "Append a value to a JSON list",
+        pure = True
     )
 
 def make_json_list_pop_command():
@@ -85,7 +92,8 @@ def make_json_list_pop_command():
         json_list_pop,
         "json-list-pop",
         "json-list-pop json-string",
-        "Pop a value off of a JSON list"
+        "Pop a value off of a JSON list",
+        pure = True
     )
 
 def make_json_list_set_command():
@@ -113,7 +121,8 @@ def make_json_list_set_command():
         json_list_set,
         "json-list-set",
         "json-list-set json-string index value",
-        "Assign to an index in a JSON list"
+        "Assign to an index in a JSON list",
+        pure = True
     )
 
 def make_json_list_get_command():
@@ -140,7 +149,8 @@ def make_json_list_get_command():
         json_list_get,
         "json-list-get",
         "json-list-get json-string index",
-        "Extract a value at an index from a JSON list"
+        "Extract a value at an index from a JSON list",
+        pure = True
     )
 
 def make_json_get_command():
@@ -166,7 +176,8 @@ def make_json_get_command():
         json_get,
         "json-get",
         "json-get json-string selector [selectors...]",
-        "Select fields from JSON objects"
+        "Select fields from JSON objects",
+        pure = True
     )
 
 def make_json_set_command():
@@ -186,7 +197,8 @@ def make_json_set_command():
         json_set,
         "json-set",
         "json-set json-string field value",
-        "Set a field in a JSON object"
+        "Set a field in a JSON object",
+        pure = True
     )
 
 def make_json_is_list_command():
@@ -203,7 +215,8 @@ def make_json_is_list_command():
         json_is_list,
         "json-is-list",
         "json-is-list json-string",
-        "Determine if json-string represents a list"
+        "Determine if json-string represents a list",
+        pure = True
     )
 
 def make_json_is_object_command():
@@ -220,5 +233,474 @@ def make_json_is_object_command():
         json_is_object,
         "json-is-object",
         "json-is-object json-string",
-        "Determine if json-string represents an object"
+        "Determine if json-string represents an object",
+        pure = True
+    )
+
+# ========================================================================
+# Compiled paths and filters, shared by the streaming commands
+# ========================================================================
+
+path_component = re.compile(r"""
+    \.(?P<field>[A-Za-z_][A-Za-z0-9_-]*)
+    | \.?\[(?P<index>-?[0-9]+)\]
+    | \.?\[(?P<quoted>"(?:[^"\\]|\\.)*")\]
+    """, re.VERBOSE)
+
+filter_pattern = re.compile(
+    r"^\s*(?P<path>\S+?)\s*(?P<op>==|!=|<=|>=|<|>)\s*(?P<value>.+?)\s*$"
+)
+
+filter_operators = {
+    "==": lambda lhs, rhs: lhs == rhs,
+    "!=": lambda lhs, rhs: lhs != rhs,
+    "<":  lambda lhs, rhs: lhs < rhs,
+    "<=": lambda lhs, rhs: lhs <= rhs,
+    ">":  lambda lhs, rhs: lhs > rhs,
+    ">=": lambda lhs, rhs: lhs >= rhs,
+}
+
+@functools.lru_cache(maxsize = 256)
+def compile_path(path):
+    """
+    Turn a path like .users[0].name or .["odd key"] into a tuple of
+    selectors. A . before a bracket is optional, and a lone . selects the
+    whole document.
+    """
+    if path == ".":
+        return ()
+
+    selectors = []
+    position = 0
+    while position < len(path):
+        match = path_component.match(path, position)
+        if match is None:
+            raise ValueError("Invalid path: {}".format(path))
+
+        if match.group("field") is not None:
+            selectors.append(match.group("field"))
+        elif match.group("index") is not None:
+            selectors.append(int(match.group("index")))
+        else:
+            selectors.append(json.loads(match.group("quoted")))
+
+        position = match.end()
+
+    return tuple(selectors)
+
+def select(document, selectors):
+    """
+    Follow compiled selectors into a document. Raises LookupError if any
+    part of the path is missing.
+    """
+    finger = document
+    for selector in selectors:
+        if type(selector) == int and type(finger) != list:
+            raise LookupError(selector)
+        if type(selector) == str and type(finger) != dict:
+            raise LookupError(selector)
+        finger = finger[selector]
+    return finger
+
+@functools.lru_cache(maxsize = 256)
+def compile_filter(expression):
+    """
+    Turn an expression like '.status >= 500' into a predicate over
+    documents. A bare path tests for presence and truthiness.
+    """
+    match = filter_pattern.match(expression)
+
+    if match is None:
+        selectors = compile_path(expression.strip())
+
+        def present(document):
+            try:
+                return bool(select(document, selectors))
+            except LookupError:
+                return False
+
+        return present
+
+    selectors = compile_path(match.group("path"))
+    operator = filter_operators[match.group("op")]
+
+    try:
+        value = json.loads(match.group("value"))
+    except json.JSONDecodeError:
+        # Allow bare words, as in .level == error
+        value = match.group("value")
+
+    def compare(document):
+        try:
+            return operator(select(document, selectors), value)
+        except (LookupError, TypeError):
+            return False
+
+    return compare
+
+def render(value, raw = False):
+    if raw and type(value) == str:
+        return value
+    return json.dumps(value)
+
+def make_json_select_command():
+    def json_select(*args):
+        try:
+            options, paths = getopt.getopt(args, "w:r")
+        except getopt.GetoptError as e:
+            sys.stderr.write("json-select: {}\n".format(e))
+            return 2
+
+        raw = False
+        filters = []
+        try:
+            for option, value in options:
+                if option == "-r":
+                    raw = True
+                elif option == "-w":
+                    filters.append(compile_filter(value))
+
+            selectors = [compile_path(path) for path in (paths or ["."])]
+        except ValueError as e:
+            sys.stderr.write("json-select: {}\n".format(e))
+            return 2
+
+        matched = False
+        malformed = False
+        for number, line in enumerate(sys.stdin, 1):
+            if not line.strip():
+                continue
+
+            try:
+                document = json.loads(line)
+            except json.JSONDecodeError:
+                sys.stderr.write("json-select: Malformed JSON on line {}\n"
+                        .format(number))
+                malformed = True
+                continue
+
+            if not all(predicate(document) for predicate in filters):
+                continue
+
+            try:
+                projection = [select(document, selector)
+                        for selector in selectors]
+            except LookupError:
+                continue
+
+            matched = True
+            if len(projection) == 1:
+                print(render(projection[0], raw))
+            else:
+                print(json.dumps(projection))
+
+        if malformed:
+            return 2
+        return 0 if matched else 1
+
+    return command.Command(
+        json_select,
+        "json-select",
+        "json-select [-r] [-w filter]... [path...]",
+        command.helpfmt("""
+            Read JSON Lines from standard input and print the value at each
+            path for every record that passes all filters. Paths look like
+            .field.sub[0] or .["odd key"], and filters look like
+            '.status >= 500'. With several paths, each projection is printed
+            as a JSON list. -r prints strings without quotes.
+            """)
+    )
+
+# ========================================================================
+# Incremental reading of single large documents
+# ========================================================================
+
+class PathError(Exception):
+    """
+    A path that's valid, but can't be followed while streaming
+    """
+
+class StreamReader:
+    """
+    Walk one JSON document from a file-like object a chunk at a time.
+    Only the values that are asked for are decoded; everything else is
+    scanned over and dropped.
+    """
+    whitespace = " \t\r\n"
+    delimiters = whitespace + ",]}"
+    structure = re.compile(r'[\[\]{}"]')
+    string_end = re.compile(r'["\\]')
+
+    def __init__(self, source, chunk_size = 65536):
+        self.__source = source
+        self.__chunk_size = chunk_size
+        self.__buffer = ""
+        self.__position = 0
+        self.__eof = False
+        self.__decoder = json.JSONDecoder()
+
+    def fill(self):
+        """
+        Read more input, discarding what has already been consumed. Reads
+        grow with the buffer so that a long value is not rescanned too often.
+        """
+        if self.__eof: return False
+
+        chunk = self.__source.read(max(self.__chunk_size,
+            len(self.__buffer) - self.__position))
+        if not chunk:
+            self.__eof = True
+            return False
+
+        self.__buffer = self.__buffer[self.__position:] + chunk
+        self.__position = 0
+        return True
+
+    def peek(self):
+        """
+        Skip whitespace and return the next character, or "" at end of input
+        """
+        while True:
+            buffer = self.__buffer
+            position = self.__position
+            while (position < len(buffer)
+                    and buffer[position] in self.whitespace):
+                position += 1
+            self.__position = position
+
+            if position < len(buffer):
+                return buffer[position]
+            if not self.fill():
+                return ""
+
+    def expect(self, *characters):
+        found = self.peek()
+        if found not in characters or not found:
+            raise ValueError("Expected {} but found {}".format(
+                " or ".join(characters), repr(found) if found else "end"))
+        self.__position += 1
+        return found
+
+    def value(self):
+        """
+        Decode the next complete value
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.__decoder.raw_decode(self.__buffer,
+                        self.__position)
+            except json.JSONDecodeError:
+                if self.fill(): continue
+                raise
+
+            # A number, true, false or null is only known to be complete once
+            # something that can't be part of it follows
+            if (not isinstance(value, (str, list, dict))
+                    and (end == len(self.__buffer)
+                        or self.__buffer[end] not in self.delimiters)
+                    and self.fill()):
+                continue
+
+            self.__position = end
+            return value
+
+    def skip(self):
+        """
+        Step over the next value without decoding it
+        """
+        if self.peek() not in "[{":
+            if self.peek() == '"':
+                self.__position += 1
+                self.skip_string()
+            else:
+                self.value()
+            return
+
+        depth = 0
+        while True:
+            match = self.structure.search(self.__buffer, self.__position)
+            if match is None:
+                self.__position = len(self.__buffer)
+                if not self.fill():
+                    raise ValueError("Unexpected end of input")
+                continue
+
+            self.__position = match.end()
+            found = match.group()
+            if found == '"':
+                self.skip_string()
+            elif found in "[{":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def skip_string(self):
+        # Position is just past an opening quote
+        while True:
+            match = self.string_end.search(self.__buffer, self.__position)
+            if match is None:
+                self.__position = len(self.__buffer)
+                if not self.fill():
+                    raise ValueError("Unterminated string")
+                continue
+
+            if match.group() == '"':
+                self.__position = match.end()
+                return
+
+            # Escapes need the character after them to be buffered too
+            if match.end() == len(self.__buffer):
+                self.__position = match.start()
+                if not self.fill():
+                    raise ValueError("Unterminated string")
+                continue
+            self.__position = match.end() + 1
+
+    def separator(self, closing):
+        """
+        Consume a comma or the closing bracket. Returns False on the latter.
+        """
+        return self.expect(",", closing) == ","
+
+    def descend(self, selectors):
+        """
+        Move to the start of the value at the end of a compiled path. Raises
+        LookupError if it doesn't exist, and PathError if it can't be found
+        without reading further than the value.
+        """
+        for selector in selectors:
+            if type(selector) == int:
+                if selector < 0:
+                    raise PathError("Negative indices cannot be streamed")
+                if self.peek() != "[":
+                    raise LookupError(selector)
+                self.expect("[")
+                if self.peek() == "]":
+                    raise LookupError(selector)
+                for _ in range(selector):
+                    self.skip()
+                    if not self.separator("]"):
+                        raise LookupError(selector)
+            else:
+                if self.peek() != "{":
+                    raise LookupError(selector)
+                self.expect("{")
+                if self.peek() == "}":
+                    raise LookupError(selector)
+                while True:
+                    key = self.value()
+                    self.expect(":")
+                    if key == selector:
+                        break
+                    self.skip()
+                    if not self.separator("}"):
+                        raise LookupError(selector)
+
+    def items(self):
+        """
+        Iterate over the elements of the list at the current position
+        """
+        if self.peek() != "[":
+            raise TypeError("Not a list!")
+        self.expect("[")
+        if self.peek() == "]":
+            self.__position += 1
+            return
+
+        while True:
+            yield self.value()
+            if not self.separator("]"):
+                return
+
+def open_source(filename):
+    if filename is None:
+        return sys.stdin
+    return open(filename, "r")
+
+def stream_document(name, args, action):
+    """
+    Shared argument handling for commands that walk one large document
+    """
+    try:
+        options, paths = getopt.getopt(args, "f:r")
+    except getopt.GetoptError as e:
+        sys.stderr.write("{}: {}\n".format(name, e))
+        return 2
+
+    options = dict(options)
+    raw = "-r" in options
+
+    if len(paths) > 1:
+        sys.stderr.write("{}: Expected at most one path\n".format(name))
+        return 2
+
+    try:
+        selectors = compile_path(paths[0] if paths else ".")
+        source = open_source(options.get("-f"))
+    except (ValueError, OSError) as e:
+        sys.stderr.write("{}: {}\n".format(name, e))
+        return 2
+
+    try:
+        reader = StreamReader(source)
+        reader.descend(selectors)
+        return action(reader, raw)
+    except LookupError as e:
+        sys.stderr.write("{}: Field {} not found\n".format(name, e))
+        return 2
+    except PathError as e:
+        sys.stderr.write("{}: Invalid path: {}\n".format(name, e))
+        return 2
+    except TypeError as e:
+        sys.stderr.write("{}: {}\n".format(name, e))
+        return 3
+    except ValueError as e:
+        # JSONDecodeError included
+        sys.stderr.write("{}: Malformed JSON: {}\n".format(name, e))
+        return 2
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+def make_json_each_command():
+    def each(reader, raw):
+        for item in reader.items():
+            print(render(item, raw))
+        return 0
+
+    def json_each(*args):
+        return stream_document("json-each", args, each)
+
+    return command.Command(
+        json_each,
+        "json-each",
+        "json-each [-r] [-f file] [path]",
+        command.helpfmt("""
+            Print each element of the list at path, one per line, reading a
+            single JSON document from a file or standard input. Elements are
+            decoded one at a time, so the list never has to fit in memory.
+            -r prints strings without quotes.
+            """)
+    )
+
+def make_json_extract_command():
+    def extract(reader, raw):
+        print(render(reader.value(), raw))
+        return 0
+
+    def json_extract(*args):
+        return stream_document("json-extract", args, extract)
+
+    return command.Command(
+        json_extract,
+        "json-extract",
+        "json-extract [-r] [-f file] path",
+        command.helpfmt("""
+            Print the value at path in a single JSON document read from a
+            file or standard input. Everything before the value is scanned
+            over without being decoded, and nothing after it is read.
+            """)
     )
@@ -1,6 +1,6 @@
 
 from .. import command
-import sys
+import getopt, random, sys
 
 def commands():
     return [
@@ -12,7 +12,8 @@ def commands():
             make_greater_than_command(),
             make_equal_command(),
             make_increment_command(),
-            make_decrement_command()
+            make_decrement_command(),
+            make_stats_command(),
             ]
 
 def number(arg):
@@ -39,7 +40,8 @@ def make_addition_command():
             add,
             "add",
             "add lhs rhs",
-            "Add two numbers"
+            "Add two numbers",
+            pure = True
     )
 
 def make_subtraction_command():
@@ -56,7 +58,8 @@ def make_subtraction_command():
             subtract,
             "subtract",
             "subtract lhs rhs",
-            "subtract rhs from lhs"
+            "subtract rhs from lhs",
+            pure = True
     )
 
 def make_multiply_command():
@@ -73,7 +76,8 @@ def make_multiply_command():
             multiply,
             "multiply",
             "multiply lhs rhs",
-            "multiply two numbers"
+            "multiply two numbers",
+            pure = True
     )
 
 def make_divide_command():
@@ -90,7 +94,8 @@ def make_divide_command():
             divide,
             "divide",
             "divide lhs rhs",
-            "divide two numbers"
+            "divide two numbers",
+            pure = True
     )
 
 def make_less_than_command():
@@ -110,7 +115,8 @@ def make_less_than_command():
         "less-than lhs rhs",
         command.helpfmt("""
             Compare two numbers, returning true if lhs is less than rhs
-            """)
+            """),
+        pure = True
     )
 
 def make_greater_than_command():
@@ -130,7 +136,8 @@ def make_greater_than_command():
         "greater-than lhs rhs",
         command.helpfmt("""
             Compare two numbers, returning true if lhs is greater than rhs
-            """)
+            """),
+        pure = True
     )
 
 def make_equal_command():
@@ -143,7 +150,8 @@ def make_equal_command():
             "equal lhs rhs",
             command.helpfmt("""
                 Compare two numbers for equality
-                """)
+                """),
+            pure = True
             )
 
 def make_increment_command():
@@ -162,7 +170,8 @@ def make_increment_command():
             "increment number [step]",
             command.helpfmt("""
                 Increment a number by 1 (default) or by a set step amount
-                """)
+                """),
+            pure = True
             )
 
 def make_decrement_command():
@@ -181,6 +190,137 @@ def make_decrement_command():
             "decrement number [step]",
             command.helpfmt("""
                 Decrement a number by 1 (default) or by a set step amount
-                """)
+                """),
+            pure = True
             )
 
+
+class RunningStats:
+    """
+    Count, mean and variance in one pass, using Welford's method
+    """
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.__m2 = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.__m2 += delta * (x - self.mean)
+
+        if self.minimum is None or x < self.minimum: self.minimum = x
+        if self.maximum is None or x > self.maximum: self.maximum = x
+
+    @property
+    def variance(self):
+        # Sample variance
+        return self.__m2 / (self.count - 1) if self.count > 1 else 0.0
+
+class QuantileSketch:
+    """
+    Approximate quantiles in bounded memory, after Karnin, Lang and Liberty's
+    KLL sketch. Items live in levels; an item at level h stands for 2^h of
+    the inputs. When a level fills up it is sorted and every other item is
+    promoted to the next level. Lower levels get geometrically smaller
+    capacities, so the sketch holds O(k) items in total.
+    """
+    def __init__(self, k = 200, seed = None):
+        self.__k = k
+        self.__levels = [[]]
+        self.__random = random.Random(seed)
+
+    def capacity(self, level):
+        depth = len(self.__levels) - level - 1
+        return max(2, int(self.__k * (2 / 3) ** depth))
+
+    def add(self, x):
+        self.__levels[0].append(x)
+        if len(self.__levels[0]) >= self.capacity(0):
+            self.compress()
+
+    def compress(self):
+        for height in range(len(self.__levels)):
+            level = self.__levels[height]
+            if len(level) < self.capacity(height):
+                continue
+
+            if height + 1 == len(self.__levels):
+                self.__levels.append([])
+
+            level.sort()
+            # An odd item out stays behind at this level
+            leftover = [level.pop()] if len(level) % 2 else []
+            offset = self.__random.randint(0, 1)
+            self.__levels[height + 1].extend(level[offset::2])
+            self.__levels[height] = leftover
+
+    def quantile(self, q):
+        weighted = sorted((x, 2 ** height)
+                for height, level in enumerate(self.__levels)
+                for x in level)
+        if not weighted:
+            return None
+
+        total = sum(weight for _, weight in weighted)
+        target = q * total
+        seen = 0
+        for x, weight in weighted:
+            seen += weight
+            if seen >= target:
+                return x
+        return weighted[-1][0]
+
+def make_stats_command():
+    def stats(*args):
+        try:
+            options, _ = getopt.getopt(list(args), "p:")
+            percentiles = [float(p) for option, value in options
+                    for p in value.split(",")] or [50, 95, 99]
+        except (getopt.GetoptError, ValueError) as e:
+            raise TypeError(str(e))
+
+        if any(p < 0 or p > 100 for p in percentiles):
+            sys.stderr.write("Percentiles must be between 0 and 100\n")
+            return 2
+
+        running = RunningStats()
+        sketch = QuantileSketch()
+        for line in sys.stdin:
+            for token in line.split():
+                try:
+                    x = number(token)
+                except ValueError:
+                    continue
+                running.add(x)
+                sketch.add(x)
+
+        if running.count == 0:
+            sys.stderr.write("No numbers to summarize\n")
+            return 1
+
+        print("count {}".format(running.count))
+        print("mean {}".format(running.mean))
+        print("variance {}".format(running.variance))
+        print("stddev {}".format(running.variance ** 0.5))
+        print("min {}".format(running.minimum))
+        print("max {}".format(running.maximum))
+        for p in percentiles:
+            print("p{:g} {}".format(p, sketch.quantile(p / 100)))
+        return 0
+
+    return command.Command(
+            stats,
+            "stats",
+            "stats [-p percentile,...]",
+            command.helpfmt("""
+                Summarize the numbers on standard input in one pass: count,
+                mean, sample variance, standard deviation, min, max and
+                approximate percentiles (50, 95 and 99 unless given with -p).
+                Memory use stays bounded however many numbers there are.
+                Anything that isn't a number is skipped.
+                """)
+            )
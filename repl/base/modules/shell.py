@@ -1,39 +1,318 @@
-from .. import command, syntax
+from .. import command, sink, syntax
 
-import subprocess
+import asyncio, getopt, os, subprocess, sys, threading, uuid
 
 def commands():
+    pool = ShellPool()
+
     return [
-            make_shell_command(),
+            make_shell_command(pool),
+            make_shell_session_command(pool),
+            make_shell_parallel_command(),
             ]
 
-def make_shell_command():
+class ShellSession:
+    """
+    A long-running /bin/sh that runs commands written to its standard input.
+    Each command's output is followed by a line holding a sentinel that's
+    unique to that command, and the command's exit status.
+    """
+    def __init__(self):
+        self.__process = subprocess.Popen(["/bin/sh"], stdin = subprocess.PIPE,
+                stdout = subprocess.PIPE, bufsize = 0)
+
+    @property
+    def alive(self):
+        return self.__process.poll() is None
+
+    def run(self, line):
+        """
+        Run a line of shell in a subshell, with nothing on its standard input,
+        and return its output and exit status. Raises EOFError if the session
+        dies before the command finishes
+        """
+        sentinel = uuid.uuid4().hex
+
+        # eval keeps a syntax error in the line from swallowing the sentinel
+        quoted = "'" + line.replace("'", "'\\''") + "'"
+        script = "( eval {} ) < /dev/null\nprintf '\\n{} %d\\n' $?\n".format(
+                quoted, sentinel)
+        self.__process.stdin.write(script.encode("utf-8", "surrogateescape"))
+
+        marker = "\n{} ".format(sentinel).encode("ascii")
+        received = bytearray()
+        fd = self.__process.stdout.fileno()
+        while True:
+            data = os.read(fd, 65536)
+            if not data:
+                raise EOFError("Shell session ended unexpectedly")
+
+            searched = max(0, len(received) - len(marker))
+            received += data
+
+            start = received.find(marker, searched)
+            if start < 0: continue
+            end = received.find(b"\n", start + len(marker))
+            if end < 0: continue
+
+            status = int(received[start + len(marker):end])
+            return bytes(received[:start]), status
+
+    def close(self):
+        try:
+            self.__process.stdin.close()
+        except OSError:
+            pass
+        self.__process.wait()
+
+class ShellPool:
+    """
+    Shell sessions kept around between calls to `shell`, so that each call
+    doesn't have to start a new shell. Sessions that die are replaced
+    """
+    def __init__(self, size = 1):
+        self.enabled = False
+        self.size = size
+        self.__idle = []
+
+    @property
+    def running(self):
+        return len(self.__idle)
+
+    def acquire(self):
+        while self.__idle:
+            session = self.__idle.pop()
+            if session.alive:
+                return session
+            session.close()
+        return ShellSession()
+
+    def release(self, session):
+        if session.alive and len(self.__idle) < self.size:
+            self.__idle.append(session)
+        else:
+            session.close()
+
+    def run(self, line):
+        session = self.acquire()
+        try:
+            result = session.run(line)
+        except BrokenPipeError:
+            # It died while it was idle, so the command never ran
+            session.close()
+            session = ShellSession()
+            result = session.run(line)
+        except:
+            session.close()
+            raise
+
+        self.release(session)
+        return result
+
+    def resize(self, size):
+        self.size = size
+        while len(self.__idle) > size:
+            self.__idle.pop().close()
+
+    def close(self):
+        self.resize(0)
+
+def feed(source, destination):
+    """
+    Copy bytes until the source runs out or the destination stops listening
+    """
+    try:
+        while True:
+            data = source.read1(65536)
+            if not data: break
+            destination.write(data)
+    except (BrokenPipeError, ValueError):
+        pass
+    finally:
+        try:
+            destination.close()
+        except OSError:
+            pass
+
+def make_shell_command(pool):
 
     def shell(*args):
         if len(args) == 0: return 0
 
+        line = " ".join([syntax.quote(arg) for arg in args])
+
+        # Sessions have nothing to give a command on its standard input, so
+        # anything piped in needs a shell of its own
+        if pool.enabled and not isinstance(sys.stdin, sink.Pipe):
+            try:
+                output, status = pool.run(line)
+            except (OSError, EOFError) as e:
+                print("Error: {}".format(str(e)))
+                return 2
+
+            sink.write_bytes(output)
+            return status
+
+        # Only what's piped in is passed on; the REPL's own input is left for
+        # the REPL
+        piped = sys.stdin if isinstance(sys.stdin, sink.Pipe) else None
+
         try:
-            output = subprocess.check_output(
-                    " ".join([syntax.quote(arg) for arg in args]),
-                    shell = True, universal_newlines = True)
+            process = subprocess.Popen(line, shell = True,
+                    stdin = subprocess.PIPE if piped else None,
+                    stdout = subprocess.PIPE)
         except ValueError as e:
             print("Invalid arguments: {}".format(str(e)))
+            return 2
         except OSError as e:
             print("Error: {}".format(str(e)))
             return 2
-        except subprocess.CalledProcessError as e:
-            print(str(e.stdout), end = "")
-            return e.returncode
 
-        print(str(output), end = "")
-        return 0
+        # Feed input from another thread, so that neither side waits on the
+        # other while a pipe is full
+        writer = None
+        if piped:
+            writer = threading.Thread(target = feed,
+                    args = (sink.binary(piped), process.stdin), daemon = True)
+            writer.start()
+
+        try:
+            while True:
+                data = process.stdout.read1(65536)
+                if not data: break
+                sink.write_bytes(data)
+            process.wait()
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+            if writer:
+                writer.join()
+
+        return process.returncode
 
     return command.Command(
             shell,
             "shell",
             "shell command [arguments]",
             command.helpfmt("""
-                Execute a program noninteractively on the underlying system
+                Execute a program noninteractively on the underlying system.
+                Anything piped in is fed to the program as it is, and its
+                output is passed on as bytes, as it arrives, until it has to
+                become text
+                """),
+            binary = True
+    )
+
+def make_shell_session_command(pool):
+
+    def shell_session(subcommand = "status", *args):
+        if subcommand == "on":
+            pool.enabled = True
+        elif subcommand == "off":
+            pool.enabled = False
+            pool.close()
+        elif subcommand == "status":
+            print("{}\nsize {}\nrunning {}".format(
+                "on" if pool.enabled else "off", pool.size, pool.running))
+        elif subcommand == "size":
+            if len(args) != 1:
+                sys.stderr.write("Subcommand size expected a size\n")
+                return 1
+            try:
+                size = int(args[0])
+                if size < 0: raise ValueError(size)
+            except ValueError:
+                sys.stderr.write("Size must be a non-negative integer\n")
+                return 2
+            pool.resize(size)
+        else:
+            sys.stderr.write("Unrecognized subcommand: {}\n"
+                    .format(subcommand))
+            return 2
+        return 0
+
+    return command.Command(
+            shell_session,
+            "shell-session",
+            "shell-session [on, off, status, size n]",
+            command.helpfmt("""
+                Run `shell` commands in long-running shells instead of
+                starting a new shell for each one, stop doing so, show
+                whether it's happening, or change how many idle shells are
+                kept
                 """)
     )
 
+# Commands run at once by shell-parallel without -j. They're mostly waiting on
+# something other than the cpu, so this doesn't depend on how many cpus there
+# are
+default_jobs = 8
+
+async def run_parallel(lines, jobs, emit, completion_order = False):
+    """
+    Run lines of shell, at most jobs at a time, and emit each one's line,
+    output and exit status, in the order they were given or the order they
+    finish
+    """
+    limit = asyncio.Semaphore(jobs)
+
+    async def run(line):
+        async with limit:
+            process = await asyncio.create_subprocess_shell(line,
+                    stdin = subprocess.DEVNULL, stdout = subprocess.PIPE)
+            output, _ = await process.communicate()
+            return line, output, process.returncode
+
+    tasks = [asyncio.ensure_future(run(line)) for line in lines]
+    for task in (asyncio.as_completed(tasks) if completion_order else tasks):
+        emit(*(await task))
+
+def make_shell_parallel_command():
+
+    def shell_parallel(*args):
+        try:
+            options, lines = getopt.getopt(list(args), "j:ct")
+        except getopt.GetoptError:
+            raise TypeError("Bad options")
+        options = dict(options)
+
+        try:
+            jobs = int(options.get("-j", default_jobs))
+            if jobs < 1: raise ValueError(jobs)
+        except ValueError:
+            sys.stderr.write("shell-parallel: -j expects a positive number\n")
+            return 2
+
+        if not lines:
+            lines = [line.strip() for line in sys.stdin]
+        lines = [line for line in lines if line]
+
+        failures = []
+        def emit(line, output, status):
+            if "-t" in options:
+                print("# {} {}".format(status, line))
+            sink.write_bytes(output)
+            if status != 0:
+                failures.append(line)
+                sys.stderr.write("shell-parallel: exit {}: {}\n"
+                        .format(status, line))
+
+        asyncio.run(run_parallel(lines, jobs, emit, "-c" in options))
+        return 1 if failures else 0
+
+    return command.Command(
+            shell_parallel,
+            "shell-parallel",
+            "shell-parallel [-j jobs] [-c] [-t] [command lines...]",
+            command.helpfmt("""
+                Run command lines, or lines of standard input, on the
+                underlying system, at most jobs at a time (8 by default).
+                Each one's output is printed whole, in the order
+                they were given, or in the order they finish with -c. -t
+                puts a line with the exit status and command line before
+                each output. Failures are reported on standard error.
+                """),
+            binary = True
+    )
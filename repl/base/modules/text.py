@@ -1,7 +1,8 @@
 
-from .. import command
+from .. import command, cache, sink
 import re
 
+import collections, getopt, heapq, itertools, tempfile
 import sys
 
 def commands():
@@ -9,67 +10,411 @@ def commands():
             make_regex_capture_command(),
             make_regex_replace_command(),
             make_regex_match_command(),
+            make_literal_match_command(),
+            make_regex_cache_command(),
             make_length_command(),
             make_devnull_command(),
             make_strcmp_command(),
+            make_sort_command(),
+            make_uniq_command(),
+            make_wc_command(),
+            make_head_command(),
+            make_tail_command(),
+            make_split_command(),
+            make_join_command(),
+            make_group_by_command(),
             ]
 
+# Shared by every regex command, keyed by pattern and flags
+patterns = cache.LRUCache(1024)
+
+regex_flags = {
+    "-i": re.IGNORECASE,
+    "-m": re.MULTILINE,
+    "-s": re.DOTALL,
+    "-x": re.VERBOSE,
+}
+
+def compile_pattern(pattern, flags = 0):
+    key = (pattern, flags)
+    compiled = patterns.get(key)
+    if compiled is None:
+        compiled = re.compile(pattern, flags)
+        patterns.put(key, compiled)
+    return compiled
+
+# Patterns that can't be safely wrapped into one big alternation
+backreference = re.compile(r"\\[1-9]|\(\?P=|\(\?P<")
+
+class PatternSet:
+    """
+    Match any of several regexes in one pass, by combining them into an
+    alternation of named groups. The first pattern in the list that matches
+    wins, just as if they were tried one after another.
+    """
+    def __init__(self, patterns, flags = 0):
+        self.__patterns = list(patterns)
+        self.__combined = None
+        self.__separate = None
+
+        if len(self.__patterns) > 1 and not any(backreference.search(pattern)
+                for pattern in self.__patterns):
+            try:
+                self.__combined = re.compile("|".join(
+                    "(?P<p{}>{})".format(i, pattern)
+                    for i, pattern in enumerate(self.__patterns)), flags)
+            except re.error:
+                pass
+
+        if self.__combined is None:
+            self.__separate = [compile_pattern(pattern, flags)
+                    for pattern in self.__patterns]
+
+    def match(self, string):
+        """
+        Return the pattern that matches at the start of string, or None
+        """
+        if self.__combined is not None:
+            match = self.__combined.match(string)
+            if match is None:
+                return None
+            return self.__patterns[int(match.lastgroup[1:])]
+
+        for pattern, compiled in zip(self.__patterns, self.__separate):
+            if compiled.match(string):
+                return pattern
+        return None
+
+class LiteralSet:
+    """
+    Aho-Corasick automaton over a set of literal strings
+    """
+    def __init__(self, literals, ignore_case = False):
+        self.__ignore_case = ignore_case
+
+        # Node 0 is the root. Each node has transitions, a failure link, and
+        # the index of the shortest literal ending there, if any
+        self.__goto = [{}]
+        self.__fail = [0]
+        self.__output = [None]
+        self.__literals = list(literals)
+
+        for index, literal in enumerate(self.__literals):
+            if ignore_case: literal = literal.casefold()
+            node = 0
+            for character in literal:
+                following = self.__goto[node].get(character)
+                if following is None:
+                    following = len(self.__goto)
+                    self.__goto.append({})
+                    self.__fail.append(0)
+                    self.__output.append(None)
+                    self.__goto[node][character] = following
+                node = following
+            if self.__output[node] is None:
+                self.__output[node] = index
+
+        # Breadth first, so failure links always point at finished nodes
+        queue = list(self.__goto[0].values())
+        for node in queue:
+            for character, following in self.__goto[node].items():
+                queue.append(following)
+                fallback = self.__fail[node]
+                while fallback and character not in self.__goto[fallback]:
+                    fallback = self.__fail[fallback]
+                target = self.__goto[fallback].get(character, 0)
+                self.__fail[following] = target if target != following else 0
+                if self.__output[following] is None:
+                    self.__output[following] = self.__output[
+                            self.__fail[following]]
+
+        # The empty literal matches everything
+        self.__empty = "" in self.__literals
+
+    def search(self, string):
+        """
+        Return the first literal found in string, or None
+        """
+        if self.__empty:
+            return ""
+        if self.__ignore_case: string = string.casefold()
+
+        goto, fail, output = self.__goto, self.__fail, self.__output
+        node = 0
+        for character in string:
+            while node and character not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(character, 0)
+            if output[node] is not None:
+                return self.__literals[output[node]]
+        return None
+
+def compile_pattern_set(listed, flags = 0):
+    key = (PatternSet, tuple(listed), flags)
+    compiled = patterns.get(key)
+    if compiled is None:
+        compiled = PatternSet(listed, flags)
+        patterns.put(key, compiled)
+    return compiled
+
+def compile_literal_set(listed, ignore_case = False):
+    key = (LiteralSet, tuple(listed), ignore_case)
+    compiled = patterns.get(key)
+    if compiled is None:
+        compiled = LiteralSet(listed, ignore_case)
+        patterns.put(key, compiled)
+    return compiled
+
+def stdin_lines():
+    """
+    Lines of standard input, read lazily and without their newlines
+    """
+    for line in sys.stdin:
+        yield line.rstrip("\n")
+
+def parse_options(args, shortopts, longopts = []):
+    """
+    getopt, except that bad usage raises TypeError so that the REPL prints
+    the command's usage
+    """
+    try:
+        return getopt.getopt(list(args), shortopts, longopts)
+    except getopt.GetoptError as e:
+        raise TypeError(str(e))
+
+def leading_options(args, shortopts, longopts = []):
+    """
+    How many of args are options. Options end at the first argument that
+    isn't made up of known options, even if it starts with -, so that a
+    pattern like -?[0-9]+ doesn't need a -- in front of it
+    """
+    position = 0
+    while position < len(args):
+        arg = str(args[position])
+        if arg == "--":
+            return position + 1
+        if arg.startswith("--"):
+            if arg[2:] not in longopts:
+                return position
+            position += 1
+            continue
+        if len(arg) < 2 or arg[0] != "-":
+            return position
+
+        # A cluster of letters, the last of which may take a value
+        for index, letter in enumerate(arg[1:], 2):
+            if letter == ":" or letter not in shortopts:
+                return position
+            if shortopts[shortopts.index(letter) + 1:].startswith(":"):
+                if index == len(arg):
+                    position += 1 # The value is the next argument
+                break
+        position += 1
+
+    return min(position, len(args))
+
+def count_option(options, option, default):
+    try:
+        count = int(options.get(option, default))
+    except ValueError:
+        raise TypeError("{} expects a number".format(option))
+    if count < 0:
+        raise TypeError("{} must not be negative".format(option))
+    return count
+
+def read_patterns(filename):
+    with open(filename, "r") as f:
+        return [line.rstrip("\n") for line in f if line.rstrip("\n")]
+
+def parse_regex_options(args, required = 1, extra = "", multiple = False):
+    """
+    Split leading flags off of a regex command's arguments. Returns the
+    combined re flags, any other switches from extra, the required
+    arguments, and an iterable of the strings to work on. Those come from
+    standard input when none are given or when --stdin is passed, in which
+    case they are read as they are needed. Flags end at the first argument
+    that isn't one, so only a pattern that looks like flags needs a -- before
+    it.
+    If multiple is set, patterns may also be given with -e pattern or
+    -f file, and the first required argument becomes a list of patterns.
+    Bad usage raises TypeError, so the REPL prints the command's usage.
+    """
+    shortopts = "imsx" + extra + ("e:f:" if multiple else "")
+    count = leading_options(args, shortopts, ["stdin"])
+    options, rest = parse_options(args[:count], shortopts, ["stdin"])
+    rest = rest + list(args[count:])
+
+    flags = 0
+    from_stdin = False
+    switches = set()
+    listed = None
+    for option, value in options:
+        if option == "--stdin":
+            from_stdin = True
+        elif option in regex_flags:
+            flags |= regex_flags[option]
+        elif option == "-e":
+            listed = (listed or []) + [value]
+        elif option == "-f":
+            listed = (listed or []) + read_patterns(value)
+        else:
+            switches.add(option)
+
+    if listed is not None:
+        rest = [listed] + rest
+    elif multiple and rest:
+        rest = [[rest[0]]] + rest[1:]
+
+    if len(rest) < required:
+        raise TypeError("Expected at least {} arguments".format(required))
+
+    targets = rest[required:]
+    if from_stdin or len(rest) == required:
+        targets = itertools.chain(targets, stdin_lines())
+
+    return flags, switches, rest[:required], targets
+
 def make_regex_capture_command():
-    def capture(pattern, *strings):
-        pattern = re.compile(pattern)
-        captures = []
+    def capture(*args):
+        flags, _, [pattern], strings = parse_regex_options(args)
+        pattern = compile_pattern(pattern, flags)
+        captured = False
         for string in strings:
             match = pattern.search(string)
             if not match:
                  continue
 
             if match.groups():
-                captures.append(" ".join([str(group) for group in
+                print(" ".join([str(group) for group in
                     match.groups() if group]))
+                captured = True
 
-        if captures: print("\n".join(captures))
-        return 0 if captures else 1
+        return 0 if captured else 1
 
     return  command.Command(
             capture,
             "regex-capture",
-            "regex-capture pattern [strings ...]",
-            "Use regex to extract substrings"
+            "regex-capture [-imsx] [--stdin] pattern [strings ...]",
+            "Use regex to extract substrings",
+            pure = True
             )
 
 def make_regex_replace_command():
-    def replace(pattern, replacement, *targets):
-        out = []
+    def replace(*args):
+        flags, _, [pattern, replacement], targets = parse_regex_options(args,
+                2)
+        pattern = compile_pattern(pattern, flags)
         for target in targets:
-            out.append(re.sub(pattern, replacement, target))
+            print(pattern.sub(replacement, target))
 
-        out = "\n".join(out)
-        if out: print(out)
         return 0
 
     return command.Command(
             replace,
             "regex-replace",
-            "regex-replace pattern replacement [strings ...]",
-            "Do regex replacement on strings"
+            "regex-replace [-imsx] [--stdin] pattern replacement"
+                + " [strings ...]",
+            "Do regex replacement on strings",
+            pure = True
             )
 
 def make_regex_match_command():
-    def match(pattern, *targets):
-        matches = []
-        pattern = re.compile(pattern)
+    def match(*args):
+        try:
+            flags, switches, [listed], targets = parse_regex_options(args,
+                    extra = "w", multiple = True)
+        except OSError as e:
+            sys.stderr.write("regex-match: {}\n".format(e))
+            return 2
+
+        which = "-w" in switches
+        matched = False
+        patterns = compile_pattern_set(listed, flags)
         for target in targets:
-            if pattern.match(target):
-                matches.append(target)
+            found = patterns.match(target)
+            if found is not None:
+                print("{}\t{}".format(found, target) if which else target)
+                matched = True
 
-        if matches: print("\n".join(matches))
-        return 0 if matches else 1
+        return 0 if matched else 1
 
     return command.Command(
             match,
             "regex-match",
-            "regex-match pattern [strings ...]",
-            "Filter strings through a python regex",
+            "regex-match [-imsxw] [--stdin] {pattern, -e pattern..., -f file}"
+                + " [strings ...]",
+            command.helpfmt("""
+                Filter strings through a python regex. Several patterns may
+                be given with -e or read from a file with -f, one per line,
+                and are combined so that each string is only scanned once.
+                -w prefixes each match with the pattern that matched it and a
+                tab.
+                """)
+            )
+
+def make_literal_match_command():
+    def literal_match(*args):
+        try:
+            flags, switches, [listed], targets = parse_regex_options(args,
+                    extra = "w", multiple = True)
+        except OSError as e:
+            sys.stderr.write("literal-match: {}\n".format(e))
+            return 2
+
+        which = "-w" in switches
+        ignore_case = bool(flags & re.IGNORECASE)
+        matched = False
+        literals = compile_literal_set(listed, ignore_case)
+        for target in targets:
+            found = literals.search(target)
+            if found is not None:
+                print("{}\t{}".format(found, target) if which else target)
+                matched = True
+
+        return 0 if matched else 1
+
+    return command.Command(
+            literal_match,
+            "literal-match",
+            "literal-match [-iw] [--stdin] {string, -e string..., -f file}"
+                + " [strings ...]",
+            command.helpfmt("""
+                Filter strings that contain any of the given literal strings.
+                All of the literals are searched for at once with an
+                Aho-Corasick automaton. -w prefixes each match with the
+                literal that was found and a tab.
+                """)
+            )
+
+def make_regex_cache_command():
+    def regex_cache(subcommand = "stats", *args):
+        if subcommand == "stats":
+            print("\n".join(patterns.report()))
+        elif subcommand == "clear":
+            patterns.clear()
+        elif subcommand == "size":
+            if len(args) != 1:
+                sys.stderr.write("Subcommand size expected a size\n")
+                return 1
+            try:
+                patterns.resize(int(args[0]))
+            except ValueError:
+                sys.stderr.write("Size must be a non-negative integer\n")
+                return 2
+        else:
+            sys.stderr.write("Unrecognized subcommand: {}\n"
+                    .format(subcommand))
+            return 2
+        return 0
+
+    return command.Command(
+            regex_cache,
+            "regex-cache",
+            "regex-cache [stats, clear, size n]",
+            command.helpfmt("""
+                Show hit rates for the compiled pattern cache shared by the
+                regex commands, empty it, or change how many patterns it holds
+                """)
             )
 
 def make_length_command():
@@ -81,15 +426,14 @@ def make_length_command():
             length,
             "length",
             "length string",
-            "Determine the length of a string"
+            "Determine the length of a string",
+            pure = True
             )
 
 def make_devnull_command():
     def devnull():
-        try:
-            while(input()): pass
-        except EOFError as e:
-            pass
+        stdin = sink.binary(sys.stdin)
+        while stdin.read1(65536): pass
         return 0
 
     return command.Command(
@@ -107,7 +451,416 @@ def make_strcmp_command():
             strcmp,
             "strcmp",
             "strcmp lhs rhs",
-            "Compare lhs and rhs for string equality"
+            "Compare lhs and rhs for string equality",
+            pure = True
+            )
+
+
+
+# ========================================================================
+# Line-oriented builtins. These read standard input, so that they can stand
+# in for their shell equivalents in pipelines without forking.
+# ========================================================================
+
+leading_number = re.compile(
+    r"\s*[-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?"
+)
+
+def sort_key(field, separator, numeric):
+    """
+    Build a key function for lines. Fields are numbered from 1. Numeric keys
+    use the number at the start of the key, or 0 if there isn't one, like
+    sort -n.
+    """
+    def key(line):
+        if field:
+            fields = line.split(separator)
+            line = fields[field - 1] if field <= len(fields) else ""
+        if numeric:
+            match = leading_number.match(line)
+            return float(match.group()) if match else 0.0
+        return line
+
+    return key if field or numeric else None
+
+# Bytes of input sort holds in memory before spilling sorted runs to disk
+sort_buffer_size = 64 * 1024 * 1024
+
+# Rough per-line bookkeeping cost on top of the characters themselves
+sort_line_overhead = 64
+
+size_suffixes = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+def parse_size(size):
+    match = re.match(r"^([0-9]+)([KMG]?)$", size.upper())
+    if match is None:
+        raise TypeError("Invalid size: {}".format(size))
+    return int(match.group(1)) * size_suffixes[match.group(2)]
+
+def spill(run):
+    """
+    Write a sorted run to a temporary file and return the file, rewound
+    """
+    f = tempfile.TemporaryFile("w+", encoding = "utf-8",
+            errors = "surrogatepass", newline = "\n")
+    f.writelines(line + "\n" for line in run)
+    f.seek(0)
+    return f
+
+def sorted_runs(lines, key, reverse, budget):
+    """
+    Sort lines within a memory budget. Returns an iterator over the sorted
+    lines, and the temporary files backing it, which the caller must close.
+    Input that fits in the budget is sorted in memory; anything larger is
+    split into sorted runs on disk that are merged lazily.
+    """
+    files = []
+    run = []
+    used = 0
+    for line in lines:
+        run.append(line)
+        used += len(line) + sort_line_overhead
+        if used > budget:
+            run.sort(key = key, reverse = reverse)
+            files.append(spill(run))
+            run = []
+            used = 0
+
+    run.sort(key = key, reverse = reverse)
+    if not files:
+        return iter(run), files
+
+    readers = [(line.rstrip("\n") for line in f) for f in files]
+    return heapq.merge(*readers, iter(run), key = key,
+            reverse = reverse), files
+
+def make_sort_command():
+    def sort(*args):
+        options, _ = parse_options(args, "nruk:t:S:")
+        options = dict(options)
+
+        budget = sort_buffer_size
+        if "-S" in options:
+            budget = parse_size(options["-S"])
+
+        key = sort_key(count_option(options, "-k", 0), options.get("-t"),
+                "-n" in options)
+        lines, files = sorted_runs(stdin_lines(), key, "-r" in options,
+                budget)
+
+        try:
+            if "-u" in options:
+                lines = (next(group) for _, group in
+                        itertools.groupby(lines, key))
+
+            for line in lines:
+                print(line)
+        finally:
+            for f in files:
+                f.close()
+        return 0
+
+    return command.Command(
+            sort,
+            "sort",
+            "sort [-n] [-r] [-u] [-k field] [-t separator] [-S size]",
+            command.helpfmt("""
+                Sort lines of standard input. -k sorts on a field, counting
+                from 1, split on whitespace or on the separator given with -t.
+                -n compares numerically, -r reverses, and -u keeps only the
+                first of lines with equal keys.
+                Input larger than the memory budget, 64M unless -S says
+                otherwise, is sorted in runs on disk and merged.
+                """)
+            )
+
+def make_uniq_command():
+    def uniq(*args):
+        options, _ = parse_options(args, "c")
+        counts = "-c" in dict(options)
+
+        for line, group in itertools.groupby(stdin_lines()):
+            if counts:
+                print("{} {}".format(sum(1 for _ in group), line))
+            else:
+                print(line)
+        return 0
+
+    return command.Command(
+            uniq,
+            "uniq",
+            "uniq [-c]",
+            command.helpfmt("""
+                Collapse runs of identical lines of standard input. -c
+                prefixes each line with the length of its run.
+                """)
+            )
+
+def make_wc_command():
+    def wc(*args):
+        options, _ = parse_options(args, "lwc")
+        options = dict(options)
+
+        lines = words = characters = 0
+        for line in sys.stdin:
+            lines += 1
+            words += len(line.split())
+            characters += len(line)
+
+        wanted = [count for option, count in
+                [("-l", lines), ("-w", words), ("-c", characters)]
+                if option in options] or [lines, words, characters]
+
+        print(" ".join(str(count) for count in wanted))
+        return 0
+
+    return command.Command(
+            wc,
+            "wc",
+            "wc [-l] [-w] [-c]",
+            command.helpfmt("""
+                Count the lines, words and characters of standard input, or
+                only the ones asked for
+                """)
             )
 
+def make_head_command():
+    def head(*args):
+        options, _ = parse_options(args, "n:")
+        count = count_option(dict(options), "-n", 10)
+
+        for line in itertools.islice(stdin_lines(), count):
+            print(line)
+        return 0
 
+    return command.Command(
+            head,
+            "head",
+            "head [-n count]",
+            "Copy the first lines of standard input, 10 by default"
+            )
+
+def make_tail_command():
+    def tail(*args):
+        options, _ = parse_options(args, "n:")
+        count = count_option(dict(options), "-n", 10)
+
+        for line in collections.deque(stdin_lines(), maxlen = count):
+            print(line)
+        return 0
+
+    return command.Command(
+            tail,
+            "tail",
+            "tail [-n count]",
+            "Copy the last lines of standard input, 10 by default"
+            )
+
+def make_split_command():
+    def split(*args):
+        options, strings = parse_options(args, "d:")
+        separator = dict(options).get("-d")
+
+        for string in (strings or stdin_lines()):
+            for piece in string.split(separator):
+                print(piece)
+        return 0
+
+    return command.Command(
+            split,
+            "split",
+            "split [-d separator] [strings ...]",
+            command.helpfmt("""
+                Print the pieces of each string, or of each line of standard
+                input if no strings are given, one per line. Strings are split
+                on whitespace unless a separator is given.
+                """),
+            pure = True
+            )
+
+def make_join_command():
+    def join(*args):
+        options, strings = parse_options(args, "d:")
+        separator = dict(options).get("-d", " ")
+
+        print(separator.join(strings or stdin_lines()))
+        return 0
+
+    return command.Command(
+            join,
+            "join",
+            "join [-d separator] [strings ...]",
+            command.helpfmt("""
+                Join strings, or the lines of standard input if no strings are
+                given, with a separator. The default separator is a space.
+                """),
+            pure = True
+            )
+
+# ========================================================================
+# Aggregation
+# ========================================================================
+
+# name: (initial, update, result)
+aggregates = {
+    "count": (0, lambda total, _: total + 1, lambda total: total),
+    "sum": (0, lambda total, value: total + value, lambda total: total),
+    "min": (None, lambda low, value: value if low is None or value < low
+        else low, lambda low: low),
+    "max": (None, lambda high, value: value if high is None or value > high
+        else high, lambda high: high),
+    "mean": ((0, 0), lambda acc, value: (acc[0] + value, acc[1] + 1),
+        lambda acc: acc[0] / acc[1]),
+}
+
+# Top-k mode keeps this many candidates per requested result
+top_k_factor = 8
+
+def extractor(spec, separator):
+    """
+    Turn a field number (counting from 1) or a regex into a function that
+    pulls that piece out of a line, or returns None if it isn't there. A regex
+    with groups yields its first group, and its whole match otherwise.
+    """
+    if spec.isdigit() and int(spec) > 0:
+        index = int(spec) - 1
+
+        def field(line):
+            fields = line.split(separator)
+            return fields[index] if index < len(fields) else None
+
+        return field
+
+    pattern = compile_pattern(spec)
+
+    def search(line):
+        match = pattern.search(line)
+        if match is None:
+            return None
+        return match.group(1) if pattern.groups else match.group()
+
+    return search
+
+def format_number(n):
+    if type(n) == float and n.is_integer():
+        return str(int(n))
+    return str(n)
+
+class SpaceSaving:
+    """
+    Approximate heaviest hitters in fixed memory (Metwally et al.). Only
+    capacity keys are tracked; a new key replaces the lightest one and
+    inherits its weight, so weights are overestimated by at most that much.
+    Weights must not be negative.
+    """
+    def __init__(self, capacity):
+        self.__capacity = capacity
+        self.__weights = {}
+        # Lazily invalidated min-heap of (weight, key)
+        self.__heap = []
+
+    def add(self, key, weight = 1):
+        weights = self.__weights
+        if key in weights:
+            weights[key] += weight
+        elif len(weights) < self.__capacity:
+            weights[key] = weight
+        else:
+            floor, lightest = self.lightest()
+            del weights[lightest]
+            weights[key] = floor + weight
+
+        heapq.heappush(self.__heap, (weights[key], key))
+        if len(self.__heap) > 4 * self.__capacity:
+            self.__heap = [(w, k) for k, w in weights.items()]
+            heapq.heapify(self.__heap)
+
+    def lightest(self):
+        while True:
+            weight, key = self.__heap[0]
+            if self.__weights.get(key) == weight:
+                return weight, key
+            heapq.heappop(self.__heap)
+
+    def top(self, k):
+        return heapq.nlargest(k, self.__weights.items(),
+                key = lambda item: item[1])
+
+def make_group_by_command():
+    def group_by(*args):
+        options, rest = parse_options(args, "t:k:")
+        options = dict(options)
+
+        if len(rest) not in [2, 3]:
+            raise TypeError("Expected key, aggregate and maybe a value")
+
+        separator = options.get("-t")
+        key = extractor(rest[0], separator)
+
+        name = rest[1]
+        if name not in aggregates:
+            sys.stderr.write("Aggregate must be one of: {}\n"
+                    .format(", ".join(aggregates)))
+            return 2
+
+        if name != "count" and len(rest) != 3:
+            sys.stderr.write("Aggregate {} needs a value\n".format(name))
+            return 2
+        value = None
+        if name != "count" and len(rest) == 3:
+            value = extractor(rest[2], separator)
+
+        top = count_option(options, "-k", 0) if "-k" in options else None
+        if top is not None and name not in ["count", "sum"]:
+            sys.stderr.write("Only count and sum support -k\n")
+            return 2
+        if top == 0:
+            sys.stderr.write("-k must be at least 1\n")
+            return 2
+
+        initial, update, result = aggregates[name]
+        groups = {} if top is None else SpaceSaving(top * top_k_factor)
+
+        for line in stdin_lines():
+            group = key(line)
+            if group is None:
+                continue
+
+            if value is None:
+                amount = 1
+            else:
+                try:
+                    amount = float(value(line))
+                except (TypeError, ValueError):
+                    continue
+
+            if top is not None:
+                groups.add(group, amount)
+            else:
+                groups[group] = update(groups.get(group, initial), amount)
+
+        if top is not None:
+            results = groups.top(top)
+        else:
+            results = [(group, result(acc)) for group, acc in groups.items()]
+
+        for group, total in results:
+            print("{} {}".format(group, format_number(total)))
+
+        return 0 if results else 1
+
+    return command.Command(
+            group_by,
+            "group-by",
+            "group-by [-t separator] [-k top] key aggregate [value]",
+            command.helpfmt("""
+                Aggregate lines of standard input by key in a single pass and
+                print each key with its result at end of input. key and value
+                are field numbers, counting from 1, or regexes whose first
+                group (or whole match) is used. aggregate is one of count,
+                sum, min, max or mean; all but count need a value.
+                -k prints only the top keys by count or sum, tracking a fixed
+                number of candidates so memory stays bounded. The results are
+                then approximate.
+                """)
+            )
@@ -1,6 +1,6 @@
 
 import io
-import os, sys
+import hashlib, os, sys
 
 class Wiretap(io.StringIO):
     def __init__(self, *args, **kwargs):
@@ -34,3 +34,139 @@ class Wiretap(io.StringIO):
         super().write(s)
         self.flush()
 
+
+class Pipe(io.TextIOWrapper):
+    """
+    A buffer between two stages of a pipeline. It holds bytes: text written to
+    it is encoded once, binary commands write to and read from its buffer
+    directly, and it's only decoded if the next stage reads it as text.
+    Undecodable bytes survive a trip through a text command, as surrogates.
+    """
+    def __init__(self):
+        super().__init__(io.BytesIO(), encoding = "utf-8",
+                errors = "surrogateescape", newline = "\n",
+                write_through = True)
+
+    def rewind(self):
+        """
+        Get ready for the next stage to read what this one wrote
+        """
+        self.flush()
+        self.seek(0)
+        return self
+
+    def getvalue(self):
+        """
+        Everything written, as text for a terminal sink
+        """
+        self.flush()
+        return self.buffer.getvalue().decode("utf-8", "replace")
+
+class EncodedReader(io.RawIOBase):
+    """
+    Bytes read from a text stream, a line at a time so that reading from a
+    terminal doesn't block for more than it needs
+    """
+    def __init__(self, stream):
+        self.__stream = stream
+        self.__pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.__pending:
+            text = self.__stream.readline()
+            if not text:
+                return 0
+            self.__pending = text.encode("utf-8", "surrogateescape")
+
+        count = min(len(b), len(self.__pending))
+        b[:count] = self.__pending[:count]
+        self.__pending = self.__pending[count:]
+        return count
+
+def binary(stream):
+    """
+    A binary stream to read standard input through. Only pipeline buffers are
+    read directly; anything else, like the REPL's own input, may have text
+    buffered ahead that its underlying bytes don't show
+    """
+    if isinstance(stream, Pipe):
+        # Text that's been read ahead, but not handed out yet, goes back to
+        # the buffer
+        try:
+            stream.seek(stream.tell())
+        except OSError:
+            return io.BufferedReader(EncodedReader(stream))
+        return stream.buffer
+    return io.BufferedReader(EncodedReader(stream))
+
+def digest(stream):
+    """
+    A hash of what's left to read in a pipeline buffer, which is left to be
+    read from where it was
+    """
+    position = stream.tell()
+    hashed = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(1 << 16), ""):
+        hashed.update(chunk.encode("utf-8", "surrogateescape"))
+    stream.seek(position)
+    return hashed.hexdigest()
+
+def write_bytes(data):
+    """
+    Write bytes to standard output, decoding them only if standard output
+    can't take bytes
+    """
+    out = sys.stdout
+    buffer = getattr(out, "buffer", None)
+    if buffer is None:
+        out.write(bytes(data).decode("utf-8", "replace"))
+        return
+
+    out.flush()
+    buffer.write(data)
+
+class Recorder:
+    """
+    Pass writes through to a stream, keeping a copy of them until there's more
+    than limit characters to keep
+    """
+    def __init__(self, stream, limit = None):
+        self.__stream = stream
+        self.__written = []
+        self.__remaining = limit
+        self.overflowed = False
+
+    def write(self, s):
+        if not self.overflowed:
+            self.__written.append(s)
+            if self.__remaining is not None:
+                self.__remaining -= len(s)
+                if self.__remaining < 0:
+                    self.overflowed = True
+                    self.__written = []
+        return self.__stream.write(s)
+
+    def getvalue(self):
+        return "".join(self.__written)
+
+    def __getattr__(self, name):
+        return getattr(self.__stream, name)
+
+class Watched:
+    """
+    A stream that notes whether anything has been read from it
+    """
+    def __init__(self, stream):
+        self.__stream = stream
+        self.used = False
+
+    def __iter__(self):
+        self.used = True
+        return iter(self.__stream)
+
+    def __getattr__(self, name):
+        self.used = True
+        return getattr(self.__stream, name)
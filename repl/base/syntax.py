@@ -61,7 +61,7 @@ class ExpandableString:
 
             if match is not None:
                 identifier_ = match.group(1)
-                tokens.append(env.get(identifier_))
+                tokens.append(str(env.get(identifier_)))
 
             # Drop the rest of the string in
             if match is None:
@@ -133,19 +133,35 @@ def quote(string):
         # This has been a disaster
         return string
 
-# That's an oof from me
+# A token that's nothing but a reference to one variable
+reference = re.compile(r"^\$(?:([A-Za-z0-9_?#@-][A-Za-z0-9_-]*)" +
+        r"|{([A-Za-z0-9_?#@-][A-Za-z0-9_-]*)})$")
+
 def expand(string, bindings):
+    """
+    Expand a token into the arguments it stands for. Quoted strings are always
+    exactly one argument, however much whitespace or quoting their values
+    contain, and unquoted ones are split on whitespace after expansion. The
+    expanded text is never lexed again.
+    """
     _type = type(string)
 
-    if _type in [ExpandableString, NonExpandableString]:
-        # Quote to prevent splitting
-        string = _type(quote(string))
-        tokens = split_whitespace(string.expand(bindings))
-        return [ str(token) for token in tokens ]
-    elif type(string) == str:
-        # Temporarily wrap to expand cleanly
-        tokens = split_whitespace(ExpandableString(string).expand(bindings))
-        return [ str(token) for token in tokens ]
+    if _type == ExpandableString:
+        return [string.expand(bindings)]
+    elif _type == NonExpandableString:
+        return [str(string)]
+    elif _type == str:
+        if "$" not in string:
+            return [string]
+
+        # Lists given whole, like $@, are one argument per item
+        match = reference.match(string)
+        if match is not None:
+            value = bindings.get(match.group(1) or match.group(2))
+            if isinstance(value, list):
+                return [str(item) for item in value]
+
+        return ExpandableString(string).expand(bindings).split()
     else:
         # Give up
         return [string]
@@ -2,6 +2,7 @@
 indent = [
         "function",
         "while",
+        "for",
         "if",
         "elif",
         "else",
@@ -1,20 +1,21 @@
 
 import os, sys
-import json, re
+import getopt, json, re
 import time, timeit
-from io import StringIO
 from contextlib import redirect_stdout
 import itertools
 
 import atexit
 
 from .base import environment, command, syntax, common
-from .base import sink, callstack
+from .base import sink, callstack, cache
 from .base.command import helpfmt
 
+from . import Block
 from .Function import REPLFunction
 from .Conditional import Conditional
 from .Loop import Loop
+from .For import For
 
 def make_unknown_command(name):
 
@@ -33,6 +34,9 @@ class REPL:
     startup_file_pattern = ".{}rc"
     history_file_pattern = ".{}_history"
     configs_file_pattern = ".{}_vars"
+    cache_dir_pattern = ".{}_cache"
+    pure_result_limit = 1 << 14 # Characters of arguments or output cached
+    recursion_limit = 1500 # Python frames while evaluating, several per call
 
     def __init__(self,
             application_name = "repl",
@@ -79,6 +83,9 @@ class REPL:
         self.__eval_hook = None
         self.__exec_hook = None
 
+        # Results of pure commands, by name and arguments
+        self.__command_cache = cache.LRUCache(4096)
+
         self.__input_source = (input_source if not "readline"
                 in modules_enabled else sys.stdin)
         self.__output_sink = output_sink
@@ -106,6 +113,7 @@ class REPL:
             self.__keywords = {
                 "function": self.__start_function,
                 "while": self.__start_loop,
+                "for": self.__start_for,
                 "if": self.__start_conditional,
                 "break": self.__break,
                 "return": self.__return,
@@ -146,6 +154,8 @@ class REPL:
                 "debug": self.__enable_debugging,
                 "text": self.__enable_text,
                 "json": self.__enable_json,
+                "array": self.__enable_array,
+                "cache": self.__enable_cache,
         }
         self.__modules_loaded = []
 
@@ -180,6 +190,10 @@ class REPL:
         self.__add_builtin(self.make_exit_command())
         self.__add_builtin(self.make_source_command())
         self.__add_builtin(self.make_cat_command())
+        self.__add_builtin(self.make_read_command())
+        self.__add_builtin(self.make_command_cache_command())
+        for make_var_command in self.make_var_commands():
+            self.__add_builtin(make_var_command)
         self.__add_builtin(self.make_config_command())
         self.__add_builtin(self.make_env_command())
         self.__add_builtin(self.make_slice_command())
@@ -188,10 +202,16 @@ class REPL:
         self.__add_builtin(self.make_verbose_command())
         self.__add_builtin(self.make_modules_command())
         self.__add_builtin(self.make_undef_command())
+        self.__add_builtin(self.make_memo_stats_command())
+        self.__add_builtin(self.make_memo_clear_command())
         self.__add_builtin(self.make_exceptions_command())
         self.__add_builtin(self.make_true_command())
         self.__add_builtin(self.make_false_command())
         self.__add_builtin(self.make_not_command())
+        for command_ in self.make_list_commands():
+            self.__add_builtin(command_)
+        for command_ in self.make_map_commands():
+            self.__add_builtin(command_)
         return self
 
     def __add_basis(self, command):
@@ -290,7 +310,7 @@ class REPL:
     def __end_call(self):
         self.__call_stack.pop()
 
-    def eval(self, string):
+    def eval(self, string, output_redirect = None):
         """
         Unless the command is backslashed, lookup order is:
             * aliases
@@ -300,8 +320,19 @@ class REPL:
         If the command is backslashed, then the lookup order is reversed
 
         Evaluate a string as a repl command
-        The returned result is bound to the name ?, and the output is returned
+        The returned result is bound to the name ?, and the output is returned,
+        unless output_redirect is a pipeline buffer for it to go into instead
         """
+        # User functions take several python frames per call, so the limit is
+        # raised while evaluating, and put back for whoever embeds the REPL
+        limit = sys.getrecursionlimit()
+        if limit < self.recursion_limit:
+            sys.setrecursionlimit(self.recursion_limit)
+            try:
+                return self.eval(string, output_redirect)
+            finally:
+                sys.setrecursionlimit(limit)
+
         if self.__block_under_construction:
             self.__block_under_construction[-1].append(string)
             return ""
@@ -329,22 +360,25 @@ class REPL:
         # expressions, because loops would become horribly unwieldy
         bits = [bit for bit_ in bits for bit in syntax.expand(bit_, self.__env)]
 
-        bits = self.expand_subshells(bits)
-        bits = self.do_pipelines(bits)
-
-        if len(bits) == 0:
-            return ""
+        # Pipelines replace stdin as they go, so put back whatever we were
+        # reading from before, which may itself be an enclosing pipeline
+        stdin = sys.stdin
+        try:
+            bits = self.expand_subshells(bits)
+            bits = self.do_pipelines(bits)
 
-        if len(bits) == 1:
-            command = bits[0]
-            arguments = []
-        elif len(bits) > 1:
-            command, arguments = bits[0], bits[1:]
+            if len(bits) == 0:
+                return ""
 
-        stdout = self.execute(command, arguments)
+            if len(bits) == 1:
+                command = bits[0]
+                arguments = []
+            elif len(bits) > 1:
+                command, arguments = bits[0], bits[1:]
 
-        if isinstance(sys.stdin, StringIO): sys.stdin.close()
-        sys.stdin = self.__true_stdin
+            stdout = self.execute(command, arguments, output_redirect)
+        finally:
+            sys.stdin = stdin
 
         if self.__eval_hook:
             self.__eval_hook(string, stdout, self.get("?"))
@@ -358,18 +392,20 @@ class REPL:
             self.toStderr("{} {} {}".format("+" *
                 (len(self.__call_stack) + 1), command, " ".join(quoted)))
 
+        stdin = self.current_stdin()
+
         if command.strip() in self.__keywords:
             out = sink.Wiretap()
             if output_redirect:
                 out.join(output_redirect)
+            previous, sys.stdin = sys.stdin, stdin
             try:
                 result = None
-                sys.stdin = self.__input_source
                 with redirect_stdout(out):
                     result = self.__keywords[command](arguments)
             finally:
                 self.set(self.__resultvar, result or 0)
-                sys.stdin = self.__true_stdin
+                sys.stdin = previous
 
             stdout =  out.getvalue()
             out.close()
@@ -381,31 +417,80 @@ class REPL:
         if command is None:
             return ""
 
-        out = sink.Wiretap()
-        if output_redirect:
-            out.join(output_redirect)
+        if isinstance(output_redirect, sink.Pipe):
+            # Pipeline stages write straight into the next stage's input
+            out = output_redirect
+        elif command.binary and not output_redirect:
+            out = sink.Pipe()
+        else:
+            out = sink.Wiretap()
+            if output_redirect:
+                out.join(output_redirect)
 
+        previous, sys.stdin = sys.stdin, stdin
         try:
             with redirect_stdout(out):
-                sys.stdin = self.__input_source
-                result = command(*arguments)
+                if command.pure and not command.binary:
+                    result = self.__call_pure(command, arguments)
+                else:
+                    result = command(*arguments)
                 self.set(self.__resultvar, result or 0)
         except TypeError as e:
             self.toStderr("(Error) {}".format(command.usage))
             if self.__debug: raise e
             self.set(self.__resultvar, 255)
         finally:
-            sys.stdin = self.__true_stdin
+            sys.stdin = previous
             self.__end_call()
 
-        stdout = out.getvalue()
-        out.close()
+        if out is output_redirect:
+            stdout = out.getvalue() if self.__exec_hook else ""
+        else:
+            stdout = out.getvalue()
+            out.close()
 
         if self.__exec_hook:
             self.__exec_hook(command.name, arguments, stdout, self.get("?"))
 
         return stdout
 
+    def __call_pure(self, command, arguments):
+        """
+        Call a pure command, or replay what it printed and returned when it
+        was last called with the same arguments
+        """
+        # The key keeps the arguments alive, so calls with large ones, like
+        # spilled variables, aren't cached at all
+        if sum(len(argument) for argument in arguments) > \
+                self.pure_result_limit:
+            return command(*arguments)
+
+        key = (command.name, tuple(arguments))
+
+        remembered = self.__command_cache.get(key)
+        if remembered is not None:
+            output, errors, result = remembered
+            sys.stdout.write(output)
+            sys.stderr.write(errors)
+            return result
+
+        # What a command reads from standard input isn't part of the key, so
+        # results are only kept if it didn't read any, and if they're small
+        stdin, stdout, stderr = sys.stdin, sys.stdout, sys.stderr
+        sys.stdin = watched = sink.Watched(stdin)
+        sys.stdout = output = sink.Recorder(stdout, self.pure_result_limit)
+        sys.stderr = errors = sink.Recorder(stderr, self.pure_result_limit)
+        try:
+            result = command(*arguments)
+        finally:
+            sys.stdin, sys.stdout, sys.stderr = stdin, stdout, stderr
+
+        if not (watched.used or output.overflowed or errors.overflowed):
+            self.__command_cache.put(key,
+                    (output.getvalue(), errors.getvalue(), result))
+
+        return result
+
     def do_pipelines(self, bits):
         if not any(["|" in bit for bit in bits]): return bits
 
@@ -416,20 +501,31 @@ class REPL:
             bits = piped[-1] # Save the last one to execute normally
             piped = piped[:-1] # Pipeline all the rest
 
-            stdin = self.__true_stdin
-            out = None
             for command in piped:
                 command = self.expand_subshells(command)
 
-                out = StringIO()
+                out = sink.Pipe()
                 self.execute(command[0], command[1:], out)
-                stdin = out
-
-                sys.stdin = stdin
-                sys.stdin.seek(0)
+                sys.stdin = out.rewind()
 
         return bits
 
+    def current_stdin(self):
+        """
+        Whatever is being piped in, or the input source if nothing is
+        """
+        if sys.stdin is self.__true_stdin:
+            return self.__input_source
+        return sys.stdin
+
+    def expand_words(self, bits):
+        """
+        Expand variables and subshells in tokens, without running anything
+        else
+        """
+        bits = [bit for bit_ in bits for bit in syntax.expand(bit_, self.__env)]
+        return self.expand_subshells(bits)
+
     def expand_subshells(self, bits):
         # Handling subshell expansion
         if len([tick for tick in bits if tick == "`"]) % 2 != 0:
@@ -446,10 +542,14 @@ class REPL:
                 if subshell: # Closing a subshell command
                     if len(accumulator) > 0:
 
-                        accumulator = self.do_pipelines(accumulator)
+                        stdin = sys.stdin
+                        try:
+                            accumulator = self.do_pipelines(accumulator)
 
-                        fresh_bits.append(self.execute(accumulator[0],
-                            accumulator[1:]).rstrip("\n"))
+                            fresh_bits.append(self.execute(accumulator[0],
+                                accumulator[1:]).rstrip("\n"))
+                        finally:
+                            sys.stdin = stdin
 
                     accumulator = []
                 else: # Starting a subshell command
@@ -464,6 +564,28 @@ class REPL:
 
         return fresh_bits
 
+    def tail_call(self, bits):
+        """
+        Run the command a function returned by returning a backquoted command.
+        The output goes straight to the function's output, and the command's
+        status is the function's return value. User functions are only run up
+        to their own tail call, which is handed back for the caller to make
+        """
+        if not bits: return None
+
+        command = self.lookup_command(bits[0])
+        function = command.callable if command is not None else None
+
+        if not isinstance(function, REPLFunction) or function.memo is not None:
+            sys.stdout.write(self.execute(bits[0], bits[1:]))
+            return self.get(self.__resultvar)
+
+        self.__make_call(command)
+        try:
+            return function.run(bits[1:])
+        finally:
+            self.__end_call()
+
     def lookup_command(self, name):
 
         if not name: return None
@@ -545,11 +667,20 @@ class REPL:
             return "({}/Prompt error) >>> ".format(self.__name)
 
     def set(self, name, value):
-        self.__env.bind(name, str(value))
+        self.__env.bind(name, environment.store(str(value)))
         return self
 
     def set_local(self, name, value):
-        self.__env.bind_here(name, str(value))
+        self.__env.bind_here(name, environment.store(str(value)))
+        return self
+
+    # Bind lists and maps as they are, rather than as text
+    def set_value(self, name, value):
+        self.__env.bind(name, environment.wrap(value))
+        return self
+
+    def set_local_value(self, name, value):
+        self.__env.bind_here(name, environment.wrap(value))
         return self
 
     def get(self, name):
@@ -716,12 +847,10 @@ class REPL:
             self.toStderr("Failed to import shell module. Please check " +
                     "your installation")
             return
-        s = shell.make_shell_command()
-        self.__add_builtin(s)
-        self.__add_alias("!", s.name)
-
         for command in shell.commands():
-            self.__add_builtin(command) # We'll clobber, but that's fine
+            self.__add_builtin(command)
+
+        self.__add_alias("!", "shell")
 
     def __enable_readline(self):
         try:
@@ -785,6 +914,30 @@ class REPL:
         for command in _json.commands():
             self.__add_builtin(command)
 
+    def __enable_array(self):
+        try:
+            from .base.modules import array as _array
+        except ImportError as e:
+            self.toStderr("Failed to import array module. Please check " +
+                    "your installation")
+            return
+        for command in _array.commands():
+            self.__add_builtin(command)
+
+    def __enable_cache(self):
+        try:
+            from .base import diskcache
+        except ImportError as e:
+            self.toStderr("Failed to import cache module. Please check " +
+                    "your installation")
+            return
+
+        store = diskcache.DiskCache(os.path.join(self.__dotfile_root,
+            self.cache_dir_pattern.format(self.__dotfile_prefix)))
+
+        self.__add_builtin(self.make_cached_command(store))
+        self.__add_builtin(self.make_cache_command(store))
+
 # ========================================================================
 # REPL keyword handlers
 # These are handled much like REPL commands, so be careful when messing with
@@ -797,6 +950,14 @@ class REPL:
             self.set("?", "2")
             return
 
+        memo = str(rest[0]) == "--memo"
+        if memo:
+            rest = rest[1:]
+            if len(rest) == 0:
+                self.toStderr("Function must have a name")
+                self.set("?", "2")
+                return
+
         name, argspec = rest[0], rest[1:]
 
         if any(REPLFunction.forbidden_argspec_pattern.match(arg) for arg in
@@ -811,7 +972,7 @@ class REPL:
             return
 
         self.__block_under_construction.append(REPLFunction(self,
-            str(name), [str(spec) for spec in argspec]))
+            str(name), [str(spec) for spec in argspec], memo))
 
     def __start_loop(self, rest):
         if len(rest) == 0:
@@ -822,7 +983,17 @@ class REPL:
         self.__block_under_construction.append(Loop(self,
             syntax.ExpandableString(" ".join(
                 [str(bit) for bit in rest]
-            ))))
+            )), self.current_stdin()))
+
+    def __start_for(self, rest):
+        try:
+            name, mode, header = Block.for_header(rest)
+        except common.REPLSyntaxError as e:
+            self.toStderr(str(e))
+            return "2"
+
+        self.__block_under_construction.append(For(self, name, mode, header,
+            self.current_stdin()))
 
     def __start_conditional(self, rest):
         if len(rest) == 0:
@@ -839,7 +1010,22 @@ class REPL:
         raise common.REPLBreak()
 
     def __return(self, value):
-        if not value: raise common.REPLReturn(None)
+        signal = self.return_signal(value)
+        if isinstance(signal, common.TailCall):
+            raise common.REPLTailCall(signal.bits)
+        raise common.REPLReturn(signal.value)
+
+    def return_signal(self, value):
+        """
+        What `return value` hands back to the function it's in
+        """
+        if not value: return common.Return(None)
+
+        if (len(value) > 2 and value[0] == value[-1] == "`"
+                and not any(bit in ("`", "|") for bit in value[1:-1])):
+            # Arguments have to be expanded here, while the function's own
+            # variables are still in scope
+            return common.TailCall(self.expand_words(value[1:-1]))
 
         if len(value) > 1:
             raise common.REPLSyntaxError("Cannot return an expression")
@@ -848,7 +1034,7 @@ class REPL:
         value = syntax.expand(value, self.__env)[0]
 
         self.set(self.__resultvar, value or 0)
-        raise common.REPLReturn(str(value))
+        return common.Return(str(value))
 
     def __shift(self, *_):
         raise common.REPLFunctionShift()
@@ -1011,17 +1197,296 @@ class REPL:
     def make_cat_command(self):
 
         def cat():
-            try:
-                while True:
-                    print(input())
-            except EOFError:
-                return 0
+            stdin = sink.binary(sys.stdin)
+            while True:
+                data = stdin.read1(65536)
+                if not data: break
+                sink.write_bytes(data)
+            return 0
 
         return command.Command(
                 cat,
                 "cat",
                 "cat",
-                "Copy standard input to standard output"
+                "Copy standard input to standard output",
+                binary = True
+        )
+
+    def make_var_commands(self):
+        """
+        Commands for looking at long text values, which may be kept out of
+        memory, without expanding them whole
+        """
+        def spilled(value):
+            return isinstance(value, environment.SpilledValue)
+
+        def pieces(value, start = 0, end = None):
+            if spilled(value):
+                return value.chunks(start, end)
+            return [str(value)[start:end]]
+
+        def length(value):
+            return len(value) if spilled(value) else len(str(value))
+
+        def var_length(name):
+            print(length(self.get(name)))
+            return 0
+
+        def var_slice(name, start, end = None):
+            value = self.get(name)
+
+            try:
+                start, end = slice(int(start),
+                        None if end is None else int(end)).indices(
+                            length(value))[:2]
+            except ValueError:
+                self.toStderr("var-slice: start and end must be integers")
+                return 2
+
+            for piece in pieces(value, start, end):
+                sys.stdout.write(piece)
+            print()
+            return 0
+
+        def var_cat(*names):
+            for name in names:
+                for piece in pieces(self.get(name)):
+                    sys.stdout.write(piece)
+                print()
+            return 0
+
+        def var_spill(*args):
+            if not args:
+                print(environment.spill_threshold
+                        if environment.spill_threshold is not None else "off")
+                return 0
+
+            [threshold] = args
+            if threshold == "off":
+                environment.spill_threshold = None
+                return 0
+
+            try:
+                threshold = int(threshold)
+                if threshold < 0: raise ValueError(threshold)
+            except ValueError:
+                self.toStderr("var-spill: threshold must be a non-negative "
+                        "integer, or off")
+                return 2
+
+            environment.spill_threshold = threshold
+            return 0
+
+        return [
+            command.Command(
+                var_length,
+                "var-length",
+                "var-length name",
+                helpfmt("""
+                    Print the length of a variable's value
+                    """)
+            ),
+            command.Command(
+                var_slice,
+                "var-slice",
+                "var-slice name start [end]",
+                helpfmt("""
+                    Print characters start up to end of a variable's value.
+                    Negative positions count back from the end, as in python
+                    """)
+            ),
+            command.Command(
+                var_cat,
+                "var-cat",
+                "var-cat names...",
+                helpfmt("""
+                    Print variables' values, a piece at a time for values that
+                    are kept in temporary files
+                    """)
+            ),
+            command.Command(
+                var_spill,
+                "var-spill",
+                "var-spill [threshold, off]",
+                helpfmt("""
+                    Show or change how many characters a value may have before
+                    it's kept in a temporary file instead of in memory
+                    """)
+            ),
+        ]
+
+    def make_cached_command(self, store):
+
+        def cached(*args):
+            try:
+                options, bits = getopt.getopt(list(args), "t:e:",
+                        ["ttl=", "env="])
+            except getopt.GetoptError as e:
+                raise TypeError(str(e))
+            if not bits:
+                raise TypeError("cached needs a command")
+
+            ttl, names = None, []
+            for option, value in options:
+                if option in ("-e", "--env"):
+                    names.append(value)
+                    continue
+                try:
+                    ttl = float(value)
+                except ValueError:
+                    self.toStderr("cached: --ttl expects a number of seconds")
+                    return 2
+
+            key = [bits[0], bits[1:], os.getcwd(),
+                    {name: str(self.get(name)) for name in names}]
+
+            # Piped input is part of what the output depends on
+            if isinstance(sys.stdin, sink.Pipe):
+                key.append(sink.digest(sys.stdin))
+
+            remembered = store.get(key, ttl)
+            if remembered is None:
+                # Capture the output as bytes, so binary output survives
+                out = sink.Pipe()
+                self.execute(bits[0], bits[1:], output_redirect = out)
+                out.flush()
+                remembered = (out.buffer.getvalue(),
+                        str(self.get(self.__resultvar)))
+                out.close()
+                try:
+                    store.put(key, *remembered)
+                except OSError as e:
+                    self.toStderr("cached: could not store result: {}"
+                            .format(e))
+
+            output, status = remembered
+            sink.write_bytes(output)
+            return status
+
+        return command.Command(
+                cached,
+                "cached",
+                "cached [--ttl seconds] [--env name]... command [args...]",
+                helpfmt("""
+                    Run a command, or replay its output and return value
+                    from an earlier run with the same arguments, working
+                    directory and piped input, in this session or another.
+                    Results older than the ttl are run again. Each --env adds
+                    a variable's value to what has to match.
+                    """),
+                binary = True
+        )
+
+    def make_cache_command(self, store):
+
+        def cache(subcommand = "stats", *args):
+            if subcommand == "stats":
+                print("\n".join(store.report()))
+            elif subcommand == "clear":
+                store.clear()
+            elif subcommand == "size":
+                if len(args) != 1:
+                    self.toStderr("Subcommand size expected a size")
+                    return 1
+                try:
+                    store.resize(int(args[0]))
+                except ValueError:
+                    self.toStderr("Size must be a non-negative integer")
+                    return 2
+            elif subcommand == "path":
+                print(store.directory)
+            else:
+                self.toStderr("Unrecognized subcommand: {}"
+                        .format(subcommand))
+                return 2
+            return 0
+
+        return command.Command(
+                cache,
+                "cache",
+                "cache [stats, clear, size bytes, path]",
+                helpfmt("""
+                    Show hit rates for results stored by `cached`, delete
+                    them, change how many bytes of them are kept, or show
+                    where they're kept
+                    """)
+        )
+
+    def make_command_cache_command(self):
+
+        def command_cache(subcommand = "stats", *args):
+            if subcommand == "stats":
+                print("\n".join(self.__command_cache.report()))
+            elif subcommand == "clear":
+                self.__command_cache.clear()
+            elif subcommand == "size":
+                if len(args) != 1:
+                    self.toStderr("Subcommand size expected a size")
+                    return 1
+                try:
+                    self.__command_cache.resize(int(args[0]))
+                except ValueError:
+                    self.toStderr("Size must be a non-negative integer")
+                    return 2
+            else:
+                self.toStderr("Unrecognized subcommand: {}"
+                        .format(subcommand))
+                return 2
+            return 0
+
+        return command.Command(
+                command_cache,
+                "command-cache",
+                "command-cache [stats, clear, size n]",
+                helpfmt("""
+                    Show hit rates for the results of pure commands, such as
+                    the math and regex commands, which are reused when they're
+                    called again with the same arguments. Empty it, or change
+                    how many results it holds; size 0 turns it off
+                    """)
+        )
+
+    def make_read_command(self):
+
+        def read(*args):
+            count = None
+            if len(args) >= 2 and args[0] == "-n":
+                try:
+                    count = int(args[1])
+                except ValueError:
+                    self.toStderr("read: -n expects a number")
+                    return 2
+                args = args[2:]
+
+            names = list(args) or ["REPLY"]
+            for name in names:
+                if not re.match("[a-zA-Z0-9_?-][a-zA-Z0-9_-]*", name):
+                    self.toStderr("Invalid identifier name")
+                    return 2
+
+            line = (sys.stdin.readline() if count is None
+                    else sys.stdin.readline(count))
+            if not line:
+                return 1
+
+            fields = line.rstrip("\n").split(None, len(names) - 1)
+            fields += [""] * (len(names) - len(fields))
+            for name, field in zip(names, fields):
+                self.set(name, field)
+
+            return 0
+
+        return command.Command(
+                read,
+                "read",
+                "read [-n count] [names...]",
+                helpfmt("""
+                    Read a line of standard input, or at most count
+                    characters of it, and split it on whitespace into
+                    variables. The last variable gets the rest of the line, and
+                    REPLY is used if no names are given. Fails at end of input,
+                    so `cmd | while read line` stops when cmd's output runs out.
+                    """)
         )
 
     def make_config_command(self):
@@ -1245,6 +1710,75 @@ class REPL:
                     """)
         )
 
+    def __memoized(self, names):
+        """
+        The memoized user functions among names, or all of them if none are
+        named
+        """
+        memoized = {name: function.callable.memo
+                for name, function in self.__functions.items()
+                if isinstance(function.callable, REPLFunction)
+                and function.callable.memo is not None}
+
+        if not names:
+            return memoized
+
+        missing = [name for name in names if name not in memoized]
+        if missing:
+            raise LookupError("Not a memoized function: {}"
+                    .format(", ".join(missing)))
+
+        return {name: memoized[name] for name in names}
+
+    def make_memo_stats_command(self):
+
+        def memo_stats(*names):
+            try:
+                memoized = self.__memoized(names)
+            except LookupError as e:
+                self.toStderr(str(e))
+                return 1
+
+            for name, memo in memoized.items():
+                print(name)
+                print("\n".join("  " + line for line in memo.report()))
+
+            return 0
+
+        return command.Command(
+                memo_stats,
+                "memo-stats",
+                "memo-stats [names...]",
+                helpfmt("""
+                    Show cache size and hit rates for functions defined with
+                    `function --memo`
+                    """)
+        )
+
+    def make_memo_clear_command(self):
+
+        def memo_clear(*names):
+            try:
+                memoized = self.__memoized(names)
+            except LookupError as e:
+                self.toStderr(str(e))
+                return 1
+
+            for memo in memoized.values():
+                memo.clear()
+
+            return 0
+
+        return command.Command(
+                memo_clear,
+                "memo-clear",
+                "memo-clear [names...]",
+                helpfmt("""
+                    Forget the remembered results of functions defined with
+                    `function --memo`, or of all of them if none are named
+                    """)
+        )
+
     def make_exceptions_command(self):
 
         def exceptions(*args):
@@ -1448,3 +1982,133 @@ class REPL:
                     """)
                 )
 
+    def __get_container(self, name, type_):
+        value = self.get(name)
+        if not isinstance(value, type_):
+            self.toStderr("{} is not a {}".format(name,
+                "list" if type_ is environment.ListValue else "map"))
+            return None
+        return value
+
+    def make_list_commands(self):
+
+        def list_new(name, *items):
+            if not re.match("[a-zA-Z0-9_?-][a-zA-Z0-9_-]*", name):
+                self.toStderr("Invalid identifier name")
+                return 2
+            self.set_value(name, list(items))
+            return 0
+
+        def list_append(name, *items):
+            l = self.__get_container(name, environment.ListValue)
+            if l is None: return 2
+            l.extend(items)
+            return 0
+
+        def list_get(name, index):
+            l = self.__get_container(name, environment.ListValue)
+            if l is None: return 2
+            try:
+                print(l[int(index)])
+            except (ValueError, IndexError):
+                self.toStderr("No index {} in list {}".format(index, name))
+                return 2
+            return 0
+
+        def list_set(name, index, value):
+            l = self.__get_container(name, environment.ListValue)
+            if l is None: return 2
+            try:
+                l[int(index)] = value
+            except (ValueError, IndexError):
+                self.toStderr("No index {} in list {}".format(index, name))
+                return 2
+            return 0
+
+        def list_pop(name, *index):
+            l = self.__get_container(name, environment.ListValue)
+            if l is None: return 2
+            try:
+                print(l.pop(*[int(i) for i in index]))
+            except (ValueError, IndexError, TypeError):
+                self.toStderr("Nothing to pop from list {}".format(name))
+                return 2
+            return 0
+
+        def list_len(name):
+            l = self.__get_container(name, environment.ListValue)
+            if l is None: return 2
+            print(len(l))
+            return 0
+
+        return [
+            command.Command(list_new, "list-new", "list-new name [items...]",
+                "Bind name to a list of items"),
+            command.Command(list_append, "list-append",
+                "list-append name items...",
+                "Add items to the end of a list"),
+            command.Command(list_get, "list-get", "list-get name index",
+                "Print the item at an index of a list, counting from 0"),
+            command.Command(list_set, "list-set", "list-set name index value",
+                "Replace the item at an index of a list"),
+            command.Command(list_pop, "list-pop", "list-pop name [index]",
+                "Remove and print the last item of a list, or the one at index"),
+            command.Command(list_len, "list-len", "list-len name",
+                "Print the number of items in a list"),
+        ]
+
+    def make_map_commands(self):
+
+        def map_new(name):
+            if not re.match("[a-zA-Z0-9_?-][a-zA-Z0-9_-]*", name):
+                self.toStderr("Invalid identifier name")
+                return 2
+            self.set_value(name, {})
+            return 0
+
+        def map_set(name, key, value):
+            m = self.__get_container(name, environment.MapValue)
+            if m is None: return 2
+            m[key] = value
+            return 0
+
+        def map_get(name, key):
+            m = self.__get_container(name, environment.MapValue)
+            if m is None: return 2
+            if key not in m:
+                self.toStderr("No key {} in map {}".format(key, name))
+                return 1
+            print(m[key])
+            return 0
+
+        def map_has(name, key):
+            m = self.__get_container(name, environment.MapValue)
+            if m is None: return 2
+            return 0 if key in m else 1
+
+        def map_del(name, key):
+            m = self.__get_container(name, environment.MapValue)
+            if m is None: return 2
+            m.pop(key, None)
+            return 0
+
+        def map_keys(name):
+            m = self.__get_container(name, environment.MapValue)
+            if m is None: return 2
+            if m: print("\n".join(m.keys()))
+            return 0
+
+        return [
+            command.Command(map_new, "map-new", "map-new name",
+                "Bind name to an empty map"),
+            command.Command(map_set, "map-set", "map-set name key value",
+                "Associate key with value in a map"),
+            command.Command(map_get, "map-get", "map-get name key",
+                "Print the value for a key in a map"),
+            command.Command(map_has, "map-has", "map-has name key",
+                "Succeed if a map has a key"),
+            command.Command(map_del, "map-del", "map-del name key",
+                "Remove a key from a map"),
+            command.Command(map_keys, "map-keys", "map-keys name",
+                "Print the keys of a map, one per line"),
+        ]
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+
+import contextlib, io, os, signal, sys, tempfile, unittest
+from unittest import mock
+
+from repl import repl
+from repl.base.modules import array as array_module
+from repl.base.modules import json as json_module
+
+@contextlib.contextmanager
+def deadline(seconds):
+    """
+    Fail instead of hanging when a loop never finishes
+    """
+    def expire(signum, frame):
+        raise TimeoutError("Gave up after {} seconds".format(seconds))
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.alarm(seconds)
+    try:
+        yield
+    finally:
+        signal.alarm(0)
+        signal.signal(signal.SIGALRM, previous)
+
+class REPLTestCase(unittest.TestCase):
+    modules = ["math", "text", "json"]
+
+    def setUp(self):
+        home = tempfile.TemporaryDirectory()
+        self.addCleanup(home.cleanup)
+        self.home = home.name
+
+        # Relative paths in commands are relative to the temporary directory
+        cwd = os.getcwd()
+        self.addCleanup(os.chdir, cwd)
+        os.chdir(self.home)
+
+        self.errors = io.StringIO()
+        self.repl = repl.REPL("test", modules_enabled = self.modules,
+                dotfile_root = self.home, nodotfile = True, noenv = True,
+                input_source = io.StringIO(), output_sink = io.StringIO(),
+                error_sink = self.errors)
+
+    def write(self, name, text):
+        with open(os.path.join(self.home, name), "w", newline = "") as f:
+            f.write(text)
+
+    def run_lines(self, *lines):
+        """
+        Evaluate lines one at a time, returning everything they printed
+        """
+        output = io.StringIO()
+        with deadline(10), contextlib.redirect_stdout(output), \
+                contextlib.redirect_stderr(self.errors):
+            for line in lines:
+                output.write(self.repl.eval(line))
+        return output.getvalue()
+
+    def status(self):
+        return str(self.repl.get("?"))
+
+class TestCommandCache(REPLTestCase):
+    def test_pure_command_in_piped_loop(self):
+        output = self.run_lines(
+                "split a b c | while read x",
+                "echo line $x",
+                "add 1 2",
+                "done")
+        self.assertEqual(output, "line a\n3\nline b\n3\nline c\n3\n")
+
+    def test_repeated_calls_are_replayed(self):
+        self.assertEqual(self.run_lines("add 1 2", "add 1 2"), "3\n3\n")
+        self.assertIn("hits 1", self.run_lines("command-cache stats"))
+
+    def test_calls_reading_stdin_are_not_kept(self):
+        self.assertEqual(self.run_lines("echo a b | split"), "a\nb\n")
+        self.assertEqual(self.run_lines("echo c d | split"), "c\nd\n")
+        self.assertIn("size 0", self.run_lines("command-cache stats"))
+
+    def test_large_output_is_not_kept(self):
+        self.repl.pure_result_limit = 4
+        self.run_lines("split aaa bbb")
+        self.assertIn("size 0", self.run_lines("command-cache stats"))
+
+    def test_large_arguments_are_not_kept(self):
+        self.repl.pure_result_limit = 4
+        self.assertEqual(self.run_lines("length abcdefgh"), "8\n")
+        self.assertIn("size 0", self.run_lines("command-cache stats"))
+
+class TestPipes(REPLTestCase):
+    modules = ["shell", "text"]
+
+    def test_read_then_binary_consumer(self):
+        for consumer in ("cat", "! cat"):
+            output = self.run_lines(
+                    "split a b c | while read x",
+                    "echo got $x",
+                    consumer,
+                    "done")
+            self.assertEqual(output, "got a\nb\nc\n")
+
+class TestSpilledValues(REPLTestCase):
+    modules = ["shell", "text"]
+
+    def test_undecodable_bytes(self):
+        with open("bin", "wb") as f:
+            f.write(b"x\xff\xfey\n" * 4)
+
+        self.run_lines("var-spill 5",
+                "set big `! cat bin | regex-replace x z`")
+        self.assertEqual(self.run_lines("var-length big"), "19\n")
+        self.assertEqual(self.run_lines("var-slice big 0 4"),
+                "z\udcff\udcfey\n")
+
+class TestRecursion(REPLTestCase):
+    def define_deep(self):
+        self.run_lines(
+                "function deep n",
+                "if less-than $n 1",
+                "echo 0",
+                "return",
+                "endif",
+                "deep `subtract $n 1`",
+                "endfunction")
+
+    def test_non_tail_recursion_depth(self):
+        # Before functions were compiled, about 140 levels fit
+        self.define_deep()
+        self.assertEqual(self.run_lines("deep 140"), "0\n")
+
+    def test_tail_recursion_depth(self):
+        self.run_lines(
+                "function count n",
+                "if equal $n 0",
+                "echo done",
+                "return",
+                "endif",
+                "set-local n `subtract $n 1`",
+                "return `count $n`",
+                "endfunction")
+        self.assertEqual(self.run_lines("count 5000"), "done\n")
+
+    def test_limit_is_put_back_after_eval(self):
+        limit = sys.getrecursionlimit()
+        self.define_deep()
+        self.run_lines("deep 10")
+        self.assertEqual(sys.getrecursionlimit(), limit)
+
+class TestLoops(REPLTestCase):
+    modules = ["shell", "text"]
+
+    def test_bad_for_header(self):
+        for header in ("for x", "for 'a b' in c"):
+            self.run_lines(header)
+            self.assertEqual(self.status(), "2")
+        self.assertIn("Usage: for name", self.errors.getvalue())
+        self.assertIn("Invalid identifier name", self.errors.getvalue())
+
+    def test_piped_loop_in_function(self):
+        with open("bin", "wb") as f:
+            f.write(b"a\xff\nb\n")
+        self.run_lines(
+                "function show",
+                "! cat bin | while read x",
+                "! cat",
+                "done",
+                "endfunction")
+        self.assertEqual(self.run_lines("show"), "b\n")
+
+class TestJSON(REPLTestCase):
+    def test_dot_before_bracket_is_optional(self):
+        self.write("doc.json", '{"key with spaces": [4, 5]}')
+        for path in ('["key with spaces"][1]', '.["key with spaces"].[1]'):
+            self.assertEqual(
+                    self.run_lines("json-extract -f doc.json '{}'".format(path)),
+                    "5\n")
+
+        self.write("list.json", "[[1, 2]]")
+        for path in ("[0]", ".[0]"):
+            self.assertEqual(
+                    self.run_lines("json-extract -f list.json " + path),
+                    "[1, 2]\n")
+
+    def test_values_across_chunk_boundaries(self):
+        document = '[123.25, "ab\\"cd", true, null, {"k": -4e5}]'
+        expected = [123.25, 'ab"cd', True, None, {"k": -4e5}]
+        for size in range(1, len(document)):
+            reader = json_module.StreamReader(io.StringIO(document),
+                    chunk_size = size)
+            self.assertEqual(list(reader.items()), expected)
+
+    def test_number_split_by_first_chunk(self):
+        self.write("doc.json", "[" + "1," * 32766 + "25.5, 3]")
+        self.assertEqual(
+                self.run_lines("json-each -f doc.json").split()[-2:],
+                ["25.5", "3"])
+        self.assertEqual(self.run_lines("json-extract -f doc.json [32766]"),
+                "25.5\n")
+
+    def test_streamed_path_errors(self):
+        self.write("doc.json", '{"a": [1, 2, 3], "b": {"c": 1}}')
+        self.assertEqual(self.run_lines("json-extract -f doc.json .a[1]"),
+                "2\n")
+
+        self.run_lines("json-extract -f doc.json .a[-1]")
+        self.assertEqual(self.status(), "2")
+        self.assertIn("Invalid path", self.errors.getvalue())
+        self.assertNotIn("Malformed", self.errors.getvalue())
+
+        self.run_lines("json-extract -f doc.json .b[0]")
+        self.assertEqual(self.status(), "2")
+        self.assertIn("not found", self.errors.getvalue())
+        self.assertNotIn("Malformed", self.errors.getvalue())
+
+class ArrayTests:
+    """
+    Tests that both array backends have to pass alike
+    """
+    modules = ["array"]
+
+    def test_bytes_widen_before_arithmetic(self):
+        self.run_lines("array-new b byte 100 -128 5")
+        self.run_lines("array-op c b add b", "array-op d b neg")
+        self.assertEqual(self.run_lines("array-print c"), "200 -256 10\n")
+        self.assertEqual(self.run_lines("array-print d"), "-100 128 -5\n")
+
+    def test_comparisons_see_whole_values(self):
+        self.run_lines("array-new b byte 100 -128", "array-op c b lt 200")
+        self.assertEqual(self.run_lines("array-print c"), "1 1\n")
+
+    def test_division_by_zero(self):
+        self.run_lines("array-new a int 1 2", "array-new z int 1 0")
+        for line in ("array-op c a div 0", "array-op c a mod z"):
+            self.run_lines(line)
+            self.assertEqual(self.status(), "2")
+        self.assertIn("Division by zero", self.errors.getvalue())
+        self.assertIn("Modulo by zero", self.errors.getvalue())
+
+class TestArrayModuleBackend(ArrayTests, REPLTestCase):
+    def setUp(self):
+        patch = mock.patch.object(array_module, "numpy", None)
+        patch.start()
+        self.addCleanup(patch.stop)
+        super().setUp()
+
+@unittest.skipUnless(array_module.numpy, "numpy is not installed")
+class TestNumpyBackend(ArrayTests, REPLTestCase):
+    pass
+
+class TestRegex(REPLTestCase):
+    def test_pattern_with_leading_dash(self):
+        self.assertEqual(self.run_lines('regex-match "-?[0-9]+" -5'), "-5\n")
+        self.assertEqual(self.run_lines('regex-match -i "-?[a-z]+" -X'),
+                "-X\n")
+
+    def test_pattern_that_looks_like_flags(self):
+        self.assertEqual(self.run_lines("regex-match -- -i -i"), "-i\n")
+
+class TestGroupBy(REPLTestCase):
+    def test_top_keys_must_be_positive(self):
+        self.run_lines("split a b a | group-by -k 0 1 count")
+        self.assertEqual(self.status(), "2")
+        self.assertIn("-k must be at least 1", self.errors.getvalue())
+
+class TestSort(REPLTestCase):
+    modules = ["shell", "text"]
+
+    def test_spilled_runs_keep_carriage_returns(self):
+        self.write("lines.txt", "b\r\na\rx\nc\n")
+        expected = "a\rx\nb\r\nc\n"
+        self.assertEqual(self.run_lines("! cat lines.txt | sort"), expected)
+        self.assertEqual(self.run_lines("! cat lines.txt | sort -S 1"),
+                expected)
+
+class TestCached(REPLTestCase):
+    modules = ["shell", "text", "cache"]
+
+    def test_cached_in_piped_loop(self):
+        lines = ("split a b c | while read x", "cached echo x $x", "done")
+        self.assertEqual(self.run_lines(*lines), "x a\nx b\nx c\n")
+        self.assertEqual(self.run_lines(*lines), "x a\nx b\nx c\n")
+
+    def test_binary_output_is_kept_intact(self):
+        self.write("big.txt", "".join("{}\n".format(i) for i in range(2000)))
+        line = "cached ! gzip -c big.txt | ! gunzip | wc -l"
+        self.assertEqual(self.run_lines(line).split(), ["2000"])
+        self.assertEqual(self.run_lines(line).split(), ["2000"])
+
+    def test_working_directory_is_part_of_key(self):
+        os.mkdir("other")
+        self.write("data.txt", "here\n")
+        self.write(os.path.join("other", "data.txt"), "there\n")
+        self.assertEqual(self.run_lines("cached ! cat data.txt"), "here\n")
+        os.chdir("other")
+        self.assertEqual(self.run_lines("cached ! cat data.txt"), "there\n")
+
+if __name__ == "__main__":
+    unittest.main()